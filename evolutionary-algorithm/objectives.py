@@ -0,0 +1,13 @@
+import numpy as np
+
+# Test functions shared with the gradient notebook (simple-gradient-method). Coordinates are
+# indexed along the first axis, so x is one point of shape (d,) or a batch of shape (d, N).
+
+
+def himmelblau(x):
+    return (x[0]**2 + x[1] - 11)**2 + (x[0] + x[1]**2 - 7)**2
+
+
+def ackley(x):
+    x = np.asarray(x)
+    return -20 * np.exp(-0.2 * np.sqrt(np.mean(x**2, axis=0))) - np.exp(np.mean(np.cos(2 * np.pi * x), axis=0)) + 20 + np.e
@@ -0,0 +1,350 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from objectives import himmelblau, ackley
+
+
+def calculate_scores(population, function):
+    # Objectives index coordinates along the first axis, so the transposed
+    # (N, d) population is scored in a single vectorized call
+    return function(population.T)
+
+
+def selection(population, fitness_scores, draws, out):
+    # Roulette wheel: lower scores take a proportionally bigger part of the wheel
+    wheel = np.cumsum(1 / (fitness_scores + 1e-6))
+    parents_indices = np.searchsorted(wheel, draws[0] * wheel[-1], side='right')
+    np.minimum(parents_indices, len(population) - 1, out=parents_indices)
+    return np.take(population, parents_indices, axis=0, out=out)
+
+
+def tournament_selection(population, fitness_scores, draws, out):
+    # Every row of draws picks one contestant, the one with the lowest score wins
+    contestants = (draws * len(population)).astype(np.intp)
+    winners = np.take_along_axis(contestants, np.argmin(fitness_scores[contestants], axis=0)[None], axis=0)[0]
+    return np.take(population, winners, axis=0, out=out)
+
+
+def crossover(parents, pc, draws, out):
+    # One-point crossover: with probability pc the genes from a random cut point on
+    # come from a random partner. With 2 genes the cut is always after the first one.
+    length, genes = parents.shape
+    partners = (draws[1] * length).astype(np.intp)
+    cuts = 1 + (draws[2] * (genes - 1)).astype(np.intp)
+    keep = (draws[0] >= pc)[:, None] | (np.arange(genes) < cuts[:, None])
+    np.take(parents, partners, axis=0, out=out)
+    np.copyto(out, parents, where=keep)
+    return out
+
+
+def mutate(children, pm, draws, distance=0.1):
+    # draws holds two (length, genes) arrays: whether a gen mutates and where it moves
+    # within [gen - distance, gen + distance]
+    mutated, shift = draws
+    shift *= 2 * distance
+    shift -= distance
+    np.add(children, shift, out=children, where=mutated < pm)
+    return children
+
+
+def evolve(function, base_length=1000, pm=0.01, pc=0.7, genes=2, method='roulette', tournament_size=2, rng=None, population=None):
+    # Yields the population and its scores after every generation. Both arrays are
+    # reused by the next generation, the caller may change them in place
+    # (migration does) but has to copy whatever it wants to keep.
+    # A given population (e.g. from a checkpoint) replaces the random first one.
+    rng = rng if rng is not None else np.random.default_rng()
+    select = tournament_selection if method == 'tournament' else selection
+    selection_rows = tournament_size if method == 'tournament' else 1
+
+    # Both buffers are allocated once: selection writes the parents into parents, crossover and
+    # mutation write the offspring back into population, which is yielded every generation
+    if population is None:
+        population = rng.uniform(-100, 100, size=(base_length, genes))
+    else:
+        population = np.array(population, dtype=np.float64)
+        base_length, genes = population.shape
+    parents = np.empty_like(population)
+
+    # All random numbers of a generation come from one bulk draw into this buffer
+    draws = np.empty((selection_rows + 3 + 2 * genes, base_length))
+    selection_draws = draws[:selection_rows]
+    crossover_draws = draws[selection_rows:selection_rows + 3]
+    mutation_draws = draws[selection_rows + 3:].reshape(2, genes, base_length).transpose(0, 2, 1)
+
+    fitness_scores = calculate_scores(population, function)
+
+    while True:
+        rng.random(out=draws)
+
+        # Parent selection
+        select(population, fitness_scores, selection_draws, out=parents)
+
+        # Crossover
+        crossover(parents, pc, crossover_draws, out=population)
+
+        # Mutation and succession
+        mutate(population, pm, mutation_draws)
+
+        # Rating individuals, reused for the statistics and the next selection
+        fitness_scores = calculate_scores(population, function)
+        yield population, fitness_scores
+
+
+def save_checkpoint(path, population, rng, state):
+    # Written next to the old checkpoint and swapped in, so a crash never leaves half of it
+    with open(path + '.tmp', 'wb') as file:
+        np.savez(file, population=population, rng=json.dumps(rng.bit_generator.state), **state)
+    os.replace(path + '.tmp', path)
+
+
+def load_checkpoint(path, rng):
+    with np.load(path) as data:
+        rng.bit_generator.state = json.loads(str(data['rng']))
+        state = {key: data[key].item() for key in ('generation', 'best_score', 'stalled')}
+        return data['population'], state
+
+
+def checkpoint_generation(path):
+    # Generation a run resumes from, 0 without a checkpoint
+    if not os.path.exists(path):
+        return 0
+    with np.load(path) as data:
+        return data['generation'].item()
+
+
+def stream(function, base_length=1000, max_iter=None, pm=0.01, pc=0.7, genes=2, method='roulette', tournament_size=2, seed=None,
+           patience=None, tolerance=0.0, checkpoint=None, checkpoint_interval=100, log=None):
+    # Yields (generation, best score, mean score, best solution) as soon as every generation
+    # is rated. Stops after max_iter generations (None runs until the caller stops) or after
+    # patience generations without the best score improving by more than tolerance.
+    # With a checkpoint path the population and random generator state are saved every
+    # checkpoint_interval generations and an existing checkpoint is resumed from.
+    # log is the file from open_log the caller appends the yielded generations to, it is synced
+    # to disk before every checkpoint so that after a crash it is never behind the checkpoint.
+    rng = np.random.default_rng(seed)
+    state = {'generation': 0, 'best_score': np.inf, 'stalled': 0}
+    population = None
+    if checkpoint is not None and os.path.exists(checkpoint):
+        population, state = load_checkpoint(checkpoint, rng)
+        if patience is not None and state['stalled'] >= patience:
+            # The checkpointed run already stopped early
+            return
+    generations = evolve(function, base_length, pm, pc, genes, method, tournament_size, rng, population)
+
+    while max_iter is None or state['generation'] < max_iter:
+        population, fitness_scores = next(generations)
+        best_id = np.argmin(fitness_scores)
+        solution_score = fitness_scores[best_id]
+        yield state['generation'], solution_score, np.mean(fitness_scores), population[best_id].copy()
+
+        if solution_score < state['best_score'] - tolerance:
+            state['best_score'], state['stalled'] = solution_score, 0
+        else:
+            state['stalled'] += 1
+        state['generation'] += 1
+        stop = patience is not None and state['stalled'] >= patience
+        stop = stop or state['generation'] == max_iter
+
+        if checkpoint is not None and (stop or state['generation'] % checkpoint_interval == 0):
+            if log is not None:
+                log.flush()
+                os.fsync(log.fileno())
+            save_checkpoint(checkpoint, population, rng, state)
+        if stop:
+            break
+
+
+class History():
+    # The last capacity generations in preallocated arrays, the oldest ones get overwritten
+    def __init__(self, capacity, genes=2):
+        self.capacity = capacity
+        self.count = 0
+        self.generations = np.zeros(capacity, dtype=np.int64)
+        self.scores = np.zeros((capacity, 2))
+        self.solutions = np.zeros((capacity, genes))
+
+    def append(self, generation, best_score, mean_score, solution):
+        i = self.count % self.capacity
+        self.generations[i] = generation
+        self.scores[i] = best_score, mean_score
+        self.solutions[i] = solution
+        self.count += 1
+
+    def ordered(self, array):
+        if self.count <= self.capacity:
+            return array[:self.count]
+        return np.roll(array, -(self.count % self.capacity), axis=0)
+
+    @property
+    def best_scores(self):
+        return self.ordered(self.scores[:, 0])
+
+    @property
+    def mean_scores(self):
+        return self.ordered(self.scores[:, 1])
+
+    @property
+    def best_solutions(self):
+        return self.ordered(self.solutions)
+
+
+def append_log(file, generation, best_score, mean_score, solution):
+    # Append-only binary log, one float64 record per generation: generation, best score,
+    # mean score and the best solution. file has to be opened with open_log.
+    np.concatenate(([generation, best_score, mean_score], solution)).tofile(file)
+
+
+def open_log(path, generation=0, genes=2):
+    # Opens the log for appending after dropping the records of generation and later, so a run
+    # resumed from a checkpoint at that generation does not write them twice (generation 0 starts
+    # a fresh log). Raises if the log ends before generation, resuming would leave a gap in it.
+    record = (3 + genes) * 8
+    keep = 0
+    if os.path.exists(path) and os.path.getsize(path) >= record:
+        generations = np.memmap(path, dtype=np.float64, mode='r', shape=(os.path.getsize(path) // record, 3 + genes))[:, 0]
+        keep = int(np.searchsorted(generations, generation))
+        del generations
+    if keep < generation:
+        raise ValueError(f"{path} has {keep} generations, the run resumes from generation {generation}")
+    if os.path.exists(path):
+        os.truncate(path, keep * record)
+    return open(path, 'ab')
+
+
+def read_log(path, genes=2):
+    records = np.fromfile(path, dtype=np.float64).reshape(-1, 3 + genes)
+    return records[:, 0].astype(np.int64), records[:, 1], records[:, 2], records[:, 3:]
+
+
+def evolutionary_algorithm(function, base_length=1000, max_iter=1000, pm=0.01, pc=0.7, genes=2, method='roulette', tournament_size=2, seed=None,
+                           patience=None, tolerance=0.0, checkpoint=None, checkpoint_interval=100):
+    history = History(max_iter, genes)
+    generations = stream(
+        function, base_length, max_iter, pm, pc, genes, method, tournament_size, seed,
+        patience, tolerance, checkpoint, checkpoint_interval,
+    )
+
+    for i, solution_score, mean_score, solution in generations:
+        history.append(i, solution_score, mean_score, solution)
+
+        if i % (max_iter // 10) == 0 and i > 0:
+            print(f"Simulating generation {i}. This generation info:")
+            print(f"Lowest score: {solution_score}\nBest solution: {solution}")
+
+    best_solutions, best_scores, mean_scores = history.best_solutions, history.best_scores, history.mean_scores
+    if not len(best_scores):
+        print("\nNothing to do, the checkpoint has already reached max_iter")
+        return best_solutions, best_scores, mean_scores
+
+    final_solution_id = np.argmin(best_scores)
+    final_solution = best_solutions[final_solution_id]
+    final_score = best_scores[final_solution_id]
+
+    print(f"\nBest solution: {final_solution}\nScore: {final_score}\nGeneration: {history.ordered(history.generations)[final_solution_id]}")
+    return best_solutions, best_scores, mean_scores
+
+
+# Island model workers share the barrier and one block of shared memory, set up by _init_island
+_barrier = None
+_shared = None
+
+
+def _island_shapes(islands, max_iter, migrants, genes):
+    return [(islands, migrants, genes), (islands, migrants), (islands, 2, max_iter), (islands, max_iter, genes)]
+
+
+def _island_arrays(buffer, islands, max_iter, migrants, genes):
+    # Layout of the shared block, the same in the parent and in every worker:
+    # migrants sent by every island with their scores, then per generation
+    # best and mean score and the best solution of every island
+    arrays = np.frombuffer(buffer, dtype=np.float64)
+    shapes = _island_shapes(islands, max_iter, migrants, genes)
+    offsets = np.cumsum([0] + [np.prod(shape) for shape in shapes])
+    return [arrays[start:end].reshape(shape) for start, end, shape in zip(offsets, offsets[1:], shapes)]
+
+
+def _init_island(barrier, buffer, islands, max_iter, migrants, genes):
+    global _barrier, _shared
+    _barrier = barrier
+    _shared = _island_arrays(buffer, islands, max_iter, migrants, genes)
+
+
+def _run_island(index, function, params, max_iter, migration_interval, seed):
+    migration, migration_scores, history, solutions = _shared
+    islands, migrants, genes = migration.shape
+    try:
+        generations = evolve(function, genes=genes, rng=np.random.default_rng(seed), **params)
+        for i, (population, fitness_scores) in zip(range(max_iter), generations):
+            best_id = np.argmin(fitness_scores)
+            history[index, 0, i] = fitness_scores[best_id]
+            history[index, 1, i] = np.mean(fitness_scores)
+            solutions[index, i] = population[best_id]
+
+            if (i + 1) % migration_interval or i + 1 == max_iter:
+                continue
+
+            # Ring migration: the best individuals of every island replace the worst
+            # ones of the next island. The second wait keeps the slots untouched
+            # until every island has read its immigrants.
+            best = np.argpartition(fitness_scores, migrants - 1)[:migrants]
+            worst = np.argpartition(fitness_scores, -migrants)[-migrants:]
+            migration[index] = population[best]
+            migration_scores[index] = fitness_scores[best]
+            _barrier.wait()
+            population[worst] = migration[index - 1]
+            fitness_scores[worst] = migration_scores[index - 1]
+            _barrier.wait()
+    except BaseException:
+        # Do not leave the other islands waiting for this one forever
+        _barrier.abort()
+        raise
+
+
+def island_model(function, islands, max_iter=1000, migration_interval=10, migrants=5, genes=2, seed=None):
+    # islands is a list of dicts with evolve parameters (base_length, pm, pc, method,
+    # tournament_size), one process per island. All islands run at the same time
+    # because they meet at the migration barrier.
+    migrants = min(migrants, min(params.get('base_length', 1000) for params in islands) - 1)
+    migrants = max(migrants, 1)
+    shapes = _island_shapes(len(islands), max_iter, migrants, genes)
+    buffer = multiprocessing.RawArray('d', int(sum(np.prod(shape) for shape in shapes)))
+    barrier = multiprocessing.Barrier(len(islands))
+    seeds = np.random.SeedSequence(seed).spawn(len(islands))
+
+    with ProcessPoolExecutor(
+        max_workers=len(islands),
+        initializer=_init_island,
+        initargs=(barrier, buffer, len(islands), max_iter, migrants, genes),
+    ) as executor:
+        futures = [
+            executor.submit(_run_island, index, function, params, max_iter, migration_interval, seeds[index])
+            for index, params in enumerate(islands)
+        ]
+        for future in futures:
+            future.result()
+
+    _, _, history, solutions = _island_arrays(buffer, len(islands), max_iter, migrants, genes)
+    islands_history = [
+        {'best_scores': history[index, 0].copy(), 'mean_scores': history[index, 1].copy()}
+        for index in range(len(islands))
+    ]
+
+    # Global history: the best island of every generation and the mean over all
+    # individuals, weighted by the population of every island
+    best_islands = np.argmin(history[:, 0], axis=0)
+    generations = np.arange(max_iter)
+    best_solutions = list(solutions[best_islands, generations])
+    best_scores = history[best_islands, 0, generations]
+    weights = np.array([params.get('base_length', 1000) for params in islands])
+    mean_scores = weights @ history[:, 1] / weights.sum()
+
+    final_solution_id = np.argmin(best_scores)
+    final_solution = best_solutions[final_solution_id]
+    final_score = best_scores[final_solution_id]
+
+    print(f"\nBest solution: {final_solution}\nScore: {final_score}\nGeneration: {final_solution_id}")
+    return best_solutions, best_scores, mean_scores, islands_history
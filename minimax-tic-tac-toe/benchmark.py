@@ -0,0 +1,197 @@
+import argparse
+import csv
+import json
+import time
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from board import Board
+from engine import Engine
+
+FIELDS = ['engine', 'opening', 'state', 'move', 'score', 'nodes', 'cutoffs', 'tt_hits', 'tt_misses', 'max_depth', 'time']
+
+
+def default_openings(rows, cols):
+    # Empty board, the two games from the README and the centre opening
+    return [(), ((0, 0),), ((rows - 1, cols - 1),), ((rows // 2, cols // 2),)]
+
+
+def finished(game):
+    board = game.board
+    return board.check_winner('x') or board.check_winner('o') or board.check_draw()
+
+
+def self_play(engine, opening, args):
+    # The engine plays both sides from the opening until the game ends
+    with Engine(algorithm=engine, rows=args.rows, cols=args.cols, k=args.k, time_limit=args.time_limit, workers=args.workers) as game:
+        marks = ('x', 'o')
+        for turn, (row, col) in enumerate(opening):
+            game.board.place(marks[turn % 2], row, col)
+
+        records = []
+        turn = len(opening)
+        while not finished(game):
+            game.ai, game.player = marks[turn % 2], marks[(turn + 1) % 2]
+            hits, misses = game.table.hits, game.table.misses
+            start_time = time.perf_counter()
+            best = game.search()
+            end_time = time.perf_counter()
+            records.append({
+                'engine': engine,
+                'opening': ' '.join(f"{row},{col}" for row, col in opening),
+                'state': turn - len(opening) + 1,
+                'move': f"{best['pos'][0]},{best['pos'][1]}",
+                'score': float(best['score']),
+                'nodes': game.nodes,
+                'cutoffs': game.cutoffs,
+                'tt_hits': game.table.hits - hits,
+                'tt_misses': game.table.misses - misses,
+                'max_depth': game.max_depth,
+                'time': end_time - start_time,
+            })
+            game.board.place(game.ai, *best['pos'])
+            turn += 1
+    return records
+
+
+def reachable_positions(rows, cols, k):
+    # Every position that can occur in a game, as (x, o) masks, with x moving first
+    board = Board(rows, cols, k)
+    positions = set()
+    stack = [(0, 0)]
+    while stack:
+        x, o = stack.pop()
+        if (x, o) in positions:
+            continue
+        positions.add((x, o))
+        empty = board.full & ~(x | o)
+        if board.winning(x) or board.winning(o) or not empty:
+            continue
+        x_to_move = x.bit_count() == o.bit_count()
+        while empty:
+            move = empty & -empty
+            empty ^= move
+            stack.append((x | move, o) if x_to_move else (x, o | move))
+    return sorted(positions)
+
+
+def verify(args):
+    # Every engine has to play the same move with the same score as plain minimax
+    engines = ['minimax'] + [engine for engine in args.engines if engine != 'minimax']
+    nodes = dict.fromkeys(engines, 0)
+    mismatches = 0
+    checked = 0
+    board = Board(args.rows, args.cols, args.k)
+    for x, o in reachable_positions(args.rows, args.cols, args.k):
+        if board.winning(x) or board.winning(o) or not board.full & ~(x | o):
+            continue
+        mover, other = ('x', 'o') if x.bit_count() == o.bit_count() else ('o', 'x')
+        results = {}
+        for engine in engines:
+            with Engine(algorithm=engine, rows=args.rows, cols=args.cols, k=args.k, time_limit=args.time_limit, workers=args.workers) as game:
+                game.board.masks = {'x': x, 'o': o}
+                game.ai, game.player = mover, other
+                results[engine] = game.search()
+                nodes[engine] += game.nodes
+        for engine in engines[1:]:
+            expected, result = results['minimax'], results[engine]
+            if (result['pos'], result['score']) != (expected['pos'], expected['score']):
+                mismatches += 1
+                print(f"{engine} differs from minimax at x={x:#x} o={o:#x}: {result} != {expected}")
+        checked += 1
+
+    print(f"Checked {checked} positions, {mismatches} mismatches")
+    for engine in engines:
+        print(f"{engine:<20}{nodes[engine]:>12} nodes")
+    return mismatches == 0
+
+
+def summarize(records, engines):
+    summary = {}
+    for engine in engines:
+        rows = [record for record in records if record['engine'] == engine]
+        summary[engine] = {
+            'searches': len(rows),
+            'nodes': sum(record['nodes'] for record in rows),
+            'cutoffs': sum(record['cutoffs'] for record in rows),
+            'tt_hits': sum(record['tt_hits'] for record in rows),
+            'max_depth': max((record['max_depth'] for record in rows), default=0),
+            'time': sum(record['time'] for record in rows),
+        }
+    return summary
+
+
+def print_summary(summary, baseline=None):
+    print(f"{'engine':<20}{'searches':>10}{'nodes':>12}{'cutoffs':>12}{'tt hits':>12}{'depth':>7}{'time (s)':>11}")
+    for engine, totals in summary.items():
+        print(f"{engine:<20}{totals['searches']:>10}{totals['nodes']:>12}{totals['cutoffs']:>12}"
+              f"{totals['tt_hits']:>12}{totals['max_depth']:>7}{totals['time']:>11.4f}", end='')
+        if baseline is not None and engine in baseline:
+            before = baseline[engine]
+            print(f"  nodes x{totals['nodes'] / max(before['nodes'], 1):.2f}, time x{totals['time'] / max(before['time'], 1e-9):.2f}", end='')
+        print()
+
+
+def plot(records, engines, path):
+    # Mean time per state on a log scale, one bar per engine
+    fig, ax = plt.subplots(figsize=(12, 6))
+    width = 0.8 / len(engines)
+    for i, engine in enumerate(engines):
+        states = sorted({record['state'] for record in records if record['engine'] == engine})
+        times = [
+            np.mean([record['time'] for record in records if record['engine'] == engine and record['state'] == state])
+            for state in states
+        ]
+        ax.bar(np.array(states) + i * width, times, width, label=engine)
+    ax.set_xlabel('State Number')
+    ax.set_ylabel('Time (s)')
+    ax.set_yscale('log')
+    ax.legend()
+    fig.savefig(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless self-play benchmark of the search engines")
+    parser.add_argument('--engines', nargs='+', default=['minimax', 'alpha-beta', 'pvs'])
+    parser.add_argument('--rows', type=int, default=3)
+    parser.add_argument('--cols', type=int, default=3)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--time-limit', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, help="processes for parallel-alpha-beta, all cores by default")
+    parser.add_argument('--json', help="write every search record to this JSON file")
+    parser.add_argument('--csv', help="write every search record to this CSV file")
+    parser.add_argument('--plot', help="save the log-scale time plot to this file")
+    parser.add_argument('--baseline', help="JSON file of an earlier run to compare the totals with")
+    parser.add_argument('--verify', action='store_true', help="compare the engines with minimax on every reachable position")
+    args = parser.parse_args()
+
+    if args.verify:
+        raise SystemExit(0 if verify(args) else 1)
+
+    records = []
+    for opening in default_openings(args.rows, args.cols):
+        for engine in args.engines:
+            records += self_play(engine, opening, args)
+
+    summary = summarize(records, args.engines)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = summarize(json.load(file), args.engines)
+    print_summary(summary, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(records, file, indent=2)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    if args.plot:
+        plot(records, args.engines, args.plot)
+
+
+if __name__ == "__main__":
+    main()
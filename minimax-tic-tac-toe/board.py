@@ -0,0 +1,168 @@
+from functools import lru_cache
+
+# Symmetries map the board in chunks of CHUNK cells through lookup tables
+CHUNK = 9
+CHUNK_MASK = (1 << CHUNK) - 1
+# Boards up to this many cells get a lookup table of all winning masks
+WINNING_TABLE_CELLS = 16
+
+
+def _lines(rows, cols, k):
+    # Masks of every k cells in a row, column or diagonal
+    lines = []
+    for row in range(rows):
+        for col in range(cols):
+            for drow, dcol in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                end_row, end_col = row + drow * (k - 1), col + dcol * (k - 1)
+                if 0 <= end_row < rows and 0 <= end_col < cols:
+                    lines.append(sum(1 << ((row + drow * i) * cols + col + dcol * i) for i in range(k)))
+    return tuple(lines)
+
+
+def _symmetries(rows, cols):
+    # Cell permutations of the rotations and reflections that map the board onto itself
+    transforms = [
+        lambda row, col: (row, cols - 1 - col),
+        lambda row, col: (rows - 1 - row, col),
+        lambda row, col: (rows - 1 - row, cols - 1 - col),
+    ]
+    if rows == cols:
+        transforms += [
+            lambda row, col: (col, row),
+            lambda row, col: (col, rows - 1 - row),
+            lambda row, col: (cols - 1 - col, row),
+            lambda row, col: (cols - 1 - col, rows - 1 - row),
+        ]
+
+    cells = rows * cols
+    symmetries = []
+    permutations = [tuple(range(cells))]
+    for transform in transforms:
+        permutation = [transform(*divmod(cell, cols)) for cell in range(cells)]
+        permutation = [row * cols + col for row, col in permutation]
+        permutations.append(tuple(permutation))
+        chunks = []
+        for shift in range(0, cells, CHUNK):
+            width = min(CHUNK, cells - shift)
+            table = tuple(
+                sum(1 << permutation[shift + i] for i in range(width) if mask >> i & 1)
+                for mask in range(1 << width)
+            )
+            chunks.append((shift, table))
+        symmetries.append(tuple(chunks))
+    return tuple(symmetries), tuple(permutations)
+
+
+@lru_cache(maxsize=None)
+def geometry(rows, cols, k):
+    lines = _lines(rows, cols, k)
+    winning = None
+    if rows * cols <= WINNING_TABLE_CELLS:
+        winning = tuple(
+            any(mask & line == line for line in lines)
+            for mask in range(1 << rows * cols)
+        )
+    # Cells on more lines are searched first (centre, corners, then edges on 3x3),
+    # ties are broken by the distance to the centre of the board
+    order = sorted(
+        range(rows * cols),
+        key=lambda cell: (
+            -sum(line >> cell & 1 for line in lines),
+            abs(2 * (cell // cols) - rows + 1) + abs(2 * (cell % cols) - cols + 1),
+        ),
+    )
+    symmetries, permutations = _symmetries(rows, cols)
+    return lines, winning, symmetries, permutations, tuple(1 << cell for cell in order)
+
+
+class Board():
+    def __init__(self, rows=3, cols=3, k=3):
+        if not 1 <= k <= max(rows, cols):
+            raise ValueError(f"Cannot get {k} in a row on a {rows}x{cols} board")
+        self.rows = rows
+        self.cols = cols
+        self.k = k
+        self.cells = rows * cols
+        self.full = (1 << self.cells) - 1
+        self.lines, table, self.symmetries, self.permutations, self.order = geometry(rows, cols, k)
+        # winning(mask) tells whether the cells in mask contain a full line
+        self.winning = table.__getitem__ if table is not None else self._winning
+        self.masks = {'x': 0, 'o': 0}
+
+    def _winning(self, mask):
+        for line in self.lines:
+            if mask & line == line:
+                return True
+        return False
+
+    def canonical(self, first, second):
+        # The same key for all rotations and reflections of a position
+        key = first << self.cells | second
+        for chunks in self.symmetries:
+            first_transformed = second_transformed = 0
+            for shift, table in chunks:
+                first_transformed |= table[first >> shift & CHUNK_MASK]
+                second_transformed |= table[second >> shift & CHUNK_MASK]
+            transformed = first_transformed << self.cells | second_transformed
+            if transformed < key:
+                key = transformed
+        return key
+
+    def canonical_symmetry(self, first, second):
+        # Same key as canonical, plus the index of the permutation that produces it
+        keys = [
+            self.transform(first, symmetry) << self.cells | self.transform(second, symmetry)
+            for symmetry in range(len(self.permutations))
+        ]
+        symmetry = min(range(len(keys)), key=keys.__getitem__)
+        return keys[symmetry], symmetry
+
+    def transform(self, mask, symmetry):
+        permutation = self.permutations[symmetry]
+        return sum(1 << permutation[cell] for cell in range(self.cells) if mask >> cell & 1)
+
+    def untransform(self, mask, symmetry):
+        permutation = self.permutations[symmetry]
+        return sum(1 << cell for cell in range(self.cells) if mask >> permutation[cell] & 1)
+
+    def parse(self, text):
+        if len(text) != self.cells:
+            raise ValueError(f"Expected {self.cells} cells, got {len(text)}")
+        x = sum(1 << cell for cell, mark in enumerate(text) if mark == 'x')
+        o = sum(1 << cell for cell, mark in enumerate(text) if mark == 'o')
+        if not 0 <= x.bit_count() - o.bit_count() <= 1:
+            raise ValueError(f"Position {text!r} cannot occur with x moving first")
+        return x, o
+
+    def bit(self, row, col):
+        return 1 << (row * self.cols + col)
+
+    def position(self, move):
+        return divmod(move.bit_length() - 1, self.cols)
+
+    def empty(self):
+        return self.full & ~(self.masks['x'] | self.masks['o'])
+
+    def is_free(self, row, col):
+        return 0 <= row < self.rows and 0 <= col < self.cols and bool(self.empty() & self.bit(row, col))
+
+    def place(self, mark, row, col):
+        self.masks[mark] |= self.bit(row, col)
+
+    def cell(self, row, col):
+        for mark, mask in self.masks.items():
+            if mask & self.bit(row, col):
+                return mark
+        return ' '
+
+    def grid(self):
+        return [[self.cell(row, col) for col in range(self.cols)] for row in range(self.rows)]
+
+    def moves_left(self):
+        return self.empty().bit_count()
+
+    def check_winner(self, mark):
+        return self.winning(self.masks[mark])
+
+    def check_draw(self):
+        return self.empty() == 0
@@ -0,0 +1,580 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import tablebase
+from board import Board
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+# State of a parallel search worker process
+_worker = None
+_shared_alpha = None
+
+
+def _init_worker(rows, cols, k, table_size, shared_alpha):
+    global _worker, _shared_alpha
+    _worker = Engine(algorithm='alpha-beta', rows=rows, cols=cols, k=k, table_size=table_size)
+    _shared_alpha = shared_alpha
+
+
+def _search_root_move(search_id, ai, player, move, depth, deadline):
+    # The deadline is absolute time.monotonic(), which is the same clock in every process,
+    # so a move that waited in the queue does not get a budget of its own
+    if time.monotonic() > deadline:
+        return move, None, (0, 0, 0, 0, 0)
+    # Entries from an earlier, deeper search would make the result depend on
+    # which worker picked up the move, so every search starts with a clean table
+    if _worker.search_id != search_id:
+        _worker.table.clear()
+        _worker.search_id = search_id
+    _worker.reset_stats()
+    _worker.table.hits = _worker.table.misses = 0
+    _worker.root_empty = (_worker.board.full & ~(ai | player)).bit_count()
+    _worker.deadline = deadline
+    # One below the best score of the other workers, so that ties are still exact
+    alpha = _shared_alpha.value - 1
+    try:
+        score = _worker._alpha_beta(ai | move, player, alpha, np.inf, False, depth - 1)
+    except SearchTimeout:
+        score = None
+    finally:
+        _worker.deadline = np.inf
+
+    if score is not None:
+        with _shared_alpha.get_lock():
+            if score > _shared_alpha.value:
+                _shared_alpha.value = score
+    stats = (_worker.nodes, _worker.cutoffs, _worker.max_depth, _worker.table.hits, _worker.table.misses)
+    return move, score, stats
+
+
+class Engine():
+    def __init__(self, algorithm='minimax', rows=3, cols=3, k=3, time_limit=1.0, table_size=100_000, workers=None):
+        self.algorithm = algorithm
+        self.board = Board(rows, cols, k)
+        self.time_limit = time_limit
+        self.table = TranspositionTable(table_size)
+        self.workers = workers or os.cpu_count()
+        self.pool = None
+        self.search_id = 0
+        self.tablebase = None
+        if algorithm == 'tablebase':
+            if (rows, cols, k) != (3, 3, 3):
+                raise ValueError("The tablebase only covers the 3x3 board")
+            self.tablebase = tablebase.load()
+        self.deadline = np.inf
+        self.reset_stats()
+
+    def best_moves(self, positions):
+        # Positions are strings of rows * cols cells, row by row, with 'x', 'o' or
+        # any other character for an empty cell; x always moves first.
+        # Symmetric copies of a position are searched once and share the table.
+        board = self.board
+        saved = board.masks, getattr(self, 'ai', None), getattr(self, 'player', None)
+        keys = []
+        unique = {}
+        for position in positions:
+            x, o = board.parse(position)
+            key, symmetry = board.canonical_symmetry(x, o)
+            keys.append((key, symmetry))
+            unique.setdefault(key, (x, o, symmetry))
+
+        moves = {}
+        for key, (x, o, symmetry) in unique.items():
+            if board.winning(x) or board.winning(o) or not board.full & ~(x | o):
+                moves[key] = None
+                continue
+            board.masks = {'x': x, 'o': o}
+            self.ai, self.player = ('x', 'o') if x.bit_count() == o.bit_count() else ('o', 'x')
+            row, col = self.search()['pos']
+            # Kept in the canonical orientation, every copy maps it back to its own
+            moves[key] = board.transform(board.bit(row, col), symmetry)
+        board.masks, self.ai, self.player = saved
+
+        results = []
+        for key, symmetry in keys:
+            move = moves[key]
+            results.append(None if move is None else board.position(board.untransform(move, symmetry)))
+        return results
+
+    def search(self):
+        self.reset_stats()
+        match self.algorithm:
+            case 'minimax':
+                return self.minimax(self.board, True)
+            case 'alpha-beta':
+                return self.alpha_beta(self.board, -np.inf, np.inf, True)
+            case 'pvs':
+                return self.pvs(self.board, -np.inf, np.inf)
+            case 'iterative-deepening':
+                return self.iterative_deepening(self.board, self.time_limit)
+            case 'parallel-alpha-beta':
+                return self.parallel_alpha_beta(self.board, self.time_limit)
+            case 'tablebase':
+                move, score = self.tablebase.best_move(self.board.masks['x'], self.board.masks['o'])
+                # Terminal positions have no move, like in the other algorithms
+                pos = None if move == tablebase.NO_MOVE else divmod(move, self.board.cols)
+                return {"pos": pos, "score": score}
+
+    def reset_stats(self):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.max_depth = 0
+        self.root_empty = self.board.moves_left()
+        self.killers = [[0, 0] for _ in range(self.board.cells + 1)]
+        self.history = dict.fromkeys(self.board.order, 0)
+
+    def minimax(self, board, move_max):
+        ai, player = board.masks[self.ai], board.masks[self.player]
+        empty = board.full & ~(ai | player)
+        self.root_empty = empty.bit_count()
+        if board.winning(ai) or board.winning(player) or not empty:
+            return {"pos": None, "score": self._minimax(ai, player, move_max)}
+
+        best = {"pos": None, "score": -np.inf if move_max else np.inf}
+        while empty:
+            move = empty & -empty
+            empty ^= move
+            if move_max:
+                score = self._minimax(ai | move, player, not move_max)
+                if score > best['score']:
+                    best = {"pos": board.position(move), "score": score}
+            else:
+                score = self._minimax(ai, player | move, not move_max)
+                if score < best['score']:
+                    best = {"pos": board.position(move), "score": score}
+
+        return best
+
+    def _minimax(self, ai, player, move_max):
+        board = self.board
+        empty = board.full & ~(ai | player)
+        self.nodes += 1
+        if self.root_empty - empty.bit_count() > self.max_depth:
+            self.max_depth = self.root_empty - empty.bit_count()
+        # Only the side that has just moved can have completed a line
+        if move_max:
+            if board.winning(player):
+                return -1 * (empty.bit_count() + 1)
+        elif board.winning(ai):
+            return 1 * (empty.bit_count() + 1)
+        if not empty:
+            return 0
+
+        depth = empty.bit_count()
+        key = board.canonical(ai, player) << 1 | move_max
+        entry = self.table.get(key)
+        if entry is not None and entry[1] == EXACT and entry[2] >= depth:
+            return entry[0]
+
+        if move_max:
+            best = -np.inf
+            while empty:
+                move = empty & -empty
+                empty ^= move
+                score = self._minimax(ai | move, player, not move_max)
+                if score > best:
+                    best = score
+
+        else:
+            best = np.inf
+            while empty:
+                move = empty & -empty
+                empty ^= move
+                score = self._minimax(ai, player | move, not move_max)
+                if score < best:
+                    best = score
+
+        self.table.store(key, best, EXACT, depth)
+        return best
+
+    def alpha_beta(self, board, alpha, beta, move_max):
+        ai, player = board.masks[self.ai], board.masks[self.player]
+        empty = board.full & ~(ai | player)
+        depth = board.cells
+        self.root_empty = empty.bit_count()
+        if board.winning(ai) or board.winning(player) or not empty:
+            return {"pos": None, "score": self._alpha_beta(ai, player, alpha, beta, move_max, depth)}
+
+        best = {"pos": None, "score": -np.inf if move_max else np.inf}
+        best_move = 0
+        for move in self.ordered_moves(empty, 0):
+            # Like in minimax, a tie goes to the move that comes first on the board,
+            # so a move before the current best one is searched with a window one wider
+            tie = 1 if move < best_move else 0
+            if move_max:
+                score = self._alpha_beta(ai | move, player, max(alpha, best['score'] - tie), beta, not move_max, depth)
+                if score > best['score'] or tie and score == best['score']:
+                    best = {"pos": board.position(move), "score": score}
+                    best_move = move
+                if best['score'] >= beta:
+                    break
+            else:
+                score = self._alpha_beta(ai, player | move, alpha, min(beta, best['score'] + tie), not move_max, depth)
+                if score < best['score'] or tie and score == best['score']:
+                    best = {"pos": board.position(move), "score": score}
+                    best_move = move
+                if best['score'] <= alpha:
+                    break
+
+        return best
+
+    def pvs(self, board, alpha, beta):
+        # Negamax form of alpha_beta that scouts every move after the first
+        # one with a null window; scores are from the side to move, the AI
+        me, them = board.masks[self.ai], board.masks[self.player]
+        empty = board.full & ~(me | them)
+        depth = board.cells
+        self.root_empty = empty.bit_count()
+        if board.winning(me) or board.winning(them) or not empty:
+            return {"pos": None, "score": self._pvs(me, them, alpha, beta, depth)}
+
+        best = {"pos": None, "score": -np.inf}
+        best_move = 0
+        for move in self.ordered_moves(empty, 0):
+            tie = 1 if move < best_move else 0
+            score = -self._pvs(them, me | move, -beta, -max(alpha, best['score'] - tie), depth)
+            if score > best['score'] or tie and score == best['score']:
+                best = {"pos": board.position(move), "score": score}
+                best_move = move
+            if best['score'] >= beta:
+                break
+
+        return best
+
+    def iterative_deepening(self, board, time_limit):
+        ai, player = board.masks[self.ai], board.masks[self.player]
+        empty = board.full & ~(ai | player)
+        self.root_empty = empty.bit_count()
+        moves = self.ordered_moves(empty, 0)
+
+        best = {"pos": board.position(moves[0]), "score": -np.inf, "depth": 0}
+        self.deadline = time.monotonic() + time_limit
+        try:
+            for depth in range(1, len(moves) + 1):
+                alpha = -np.inf
+                best_move = moves[0]
+                for move in moves:
+                    # Like in minimax, a tie goes to the move that comes first on the board
+                    tie = 1 if move < best_move else 0
+                    score = self._alpha_beta(ai | move, player, alpha - tie, np.inf, False, depth - 1)
+                    if score > alpha or tie and score == alpha:
+                        alpha = score
+                        best_move = move
+                        # The score and depth stay those of the last completed iteration until
+                        # this one finishes; a move that beats that score is safe to play already
+                        if score > best['score']:
+                            best['pos'] = board.position(move)
+                best = {"pos": board.position(best_move), "score": alpha, "depth": depth}
+                moves.remove(best_move)
+                moves.insert(0, best_move)
+                # A forced win or loss has been found, deeper search cannot change it
+                if abs(best['score']) >= 1:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = np.inf
+
+        return best
+
+    def parallel_alpha_beta(self, board, time_limit):
+        # Iterative deepening with the root moves of every iteration split
+        # across the worker processes
+        ai, player = board.masks[self.ai], board.masks[self.player]
+        empty = board.full & ~(ai | player)
+        self.root_empty = empty.bit_count()
+        moves = self.ordered_moves(empty, 0)
+
+        if self.pool is None:
+            self.shared_alpha = multiprocessing.Value('d', -np.inf)
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(board.rows, board.cols, board.k, self.table.max_size, self.shared_alpha),
+            )
+        self.search_id += 1
+
+        best = {"pos": board.position(moves[0]), "score": -np.inf, "depth": 0}
+        deadline = time.monotonic() + time_limit
+        for depth in range(1, len(moves) + 1):
+            self.shared_alpha.value = -np.inf
+            futures = [
+                self.pool.submit(_search_root_move, self.search_id, ai, player, move, depth, deadline)
+                for move in moves
+            ]
+            scores = {}
+            for future in futures:
+                if future.cancelled():
+                    continue
+                move, score, (nodes, cutoffs, max_depth, hits, misses) = future.result()
+                self.nodes += nodes
+                self.cutoffs += cutoffs
+                self.max_depth = max(self.max_depth, max_depth)
+                self.table.hits += hits
+                self.table.misses += misses
+                if score is not None:
+                    scores[move] = score
+                else:
+                    # The deadline has passed, moves still waiting in the queue are dropped
+                    # and the running ones stop at their next deadline check
+                    for pending in futures:
+                        pending.cancel()
+
+            # The previous best move has to be searched at this depth for the
+            # other finished moves to be comparable with it
+            if moves[0] not in scores:
+                break
+            # Ties go to the move first on the board, whichever worker finished first
+            best_move = max(scores, key=lambda move: (scores[move], -move))
+            if len(scores) < len(moves):
+                # As in iterative_deepening, an unfinished iteration only changes the move, and
+                # only to one that beats the score of the last completed iteration
+                if scores[best_move] > best['score']:
+                    best['pos'] = board.position(best_move)
+                break
+            best = {"pos": board.position(best_move), "score": scores[best_move], "depth": depth}
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+            if abs(best['score']) >= 1:
+                break
+
+        return best
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def evaluate(self, ai, player):
+        # Lines still open to one side, weighted by how many marks they hold,
+        # squashed into (-1, 1) so that it stays below every win or loss score
+        score = 0
+        for line in self.board.lines:
+            if not line & player:
+                score += 4 ** (line & ai).bit_count() - 1
+            elif not line & ai:
+                score -= 4 ** (line & player).bit_count() - 1
+        return score / (1 + abs(score))
+
+    def _alpha_beta(self, ai, player, alpha, beta, move_max, depth):
+        board = self.board
+        empty = board.full & ~(ai | player)
+        self.nodes += 1
+        ply = self.root_empty - empty.bit_count()
+        if ply > self.max_depth:
+            self.max_depth = ply
+        if not self.nodes & 1023 and time.monotonic() > self.deadline:
+            raise SearchTimeout
+        # Only the side that has just moved can have completed a line
+        if move_max:
+            if board.winning(player):
+                return -1 * (empty.bit_count() + 1)
+        elif board.winning(ai):
+            return 1 * (empty.bit_count() + 1)
+        if not empty:
+            return 0
+
+        depth = min(depth, empty.bit_count())
+        if depth == 0:
+            return self.evaluate(ai, player)
+
+        key = board.canonical(ai, player) << 1 | move_max
+        entry = self.table.get(key)
+        if entry is not None and entry[2] >= depth:
+            score, flag, _ = entry
+            if flag == EXACT:
+                return score
+            if flag == LOWER and score >= beta:
+                return score
+            if flag == UPPER and score <= alpha:
+                return score
+        alpha_start, beta_start = alpha, beta
+
+        if move_max:
+            best = -np.inf
+            for move in self.ordered_moves(empty, ply):
+                score = self._alpha_beta(ai | move, player, alpha, beta, not move_max, depth - 1)
+                if score > best:
+                    best = score
+                    alpha = max(alpha, best)
+                    if beta <= alpha:
+                        self.store_cutoff(move, ply, depth)
+                        break
+
+        else:
+            best = np.inf
+            for move in self.ordered_moves(empty, ply):
+                score = self._alpha_beta(ai, player | move, alpha, beta, not move_max, depth - 1)
+                if score < best:
+                    best = score
+                    beta = min(beta, best)
+                    if beta <= alpha:
+                        self.store_cutoff(move, ply, depth)
+                        break
+
+        if best <= alpha_start:
+            self.table.store(key, best, UPPER, depth)
+        elif best >= beta_start:
+            self.table.store(key, best, LOWER, depth)
+        else:
+            self.table.store(key, best, EXACT, depth)
+        return best
+
+    def _pvs(self, me, them, alpha, beta, depth):
+        board = self.board
+        empty = board.full & ~(me | them)
+        self.nodes += 1
+        ply = self.root_empty - empty.bit_count()
+        if ply > self.max_depth:
+            self.max_depth = ply
+        if not self.nodes & 1023 and time.monotonic() > self.deadline:
+            raise SearchTimeout
+        if board.winning(them):
+            return -1 * (empty.bit_count() + 1)
+        if not empty:
+            return 0
+
+        depth = min(depth, empty.bit_count())
+        if depth == 0:
+            return self.evaluate(me, them)
+
+        # Same key and score sign as _alpha_beta with the AI to move
+        key = board.canonical(me, them) << 1 | 1
+        entry = self.table.get(key)
+        if entry is not None and entry[2] >= depth:
+            score, flag, _ = entry
+            if flag == EXACT:
+                return score
+            if flag == LOWER and score >= beta:
+                return score
+            if flag == UPPER and score <= alpha:
+                return score
+        alpha_start = alpha
+
+        best = -np.inf
+        for move in self.ordered_moves(empty, ply):
+            if best == -np.inf:
+                score = -self._pvs(them, me | move, -beta, -alpha, depth - 1)
+            else:
+                # Only prove that the move is not better than the best one so far,
+                # and search it again with the full window if it is
+                score = -self._pvs(them, me | move, -alpha - 1, -alpha, depth - 1)
+                if alpha < score < beta:
+                    score = -self._pvs(them, me | move, -beta, -score, depth - 1)
+            if score > best:
+                best = score
+                alpha = max(alpha, best)
+                if beta <= alpha:
+                    self.store_cutoff(move, ply, depth)
+                    break
+
+        if best <= alpha_start:
+            self.table.store(key, best, UPPER, depth)
+        elif best >= beta:
+            self.table.store(key, best, LOWER, depth)
+        else:
+            self.table.store(key, best, EXACT, depth)
+        return best
+
+    def ordered_moves(self, empty, ply):
+        # Killer moves of this ply first, then the moves that caused the most
+        # cutoffs so far, then the static order of the board
+        moves = [move for move in self.board.order if empty & move]
+        moves.sort(key=self.history.__getitem__, reverse=True)
+        for killer in self.killers[ply][::-1]:
+            if empty & killer:
+                moves.remove(killer)
+                moves.insert(0, killer)
+        return moves
+
+    def store_cutoff(self, move, ply, depth):
+        self.cutoffs += 1
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[move] += depth * depth
+
+
+class AsyncEngine():
+    # Collects move requests from many concurrent games and answers them
+    # with one Engine.best_moves call per batch
+    def __init__(self, engine, max_batch=256, max_delay=0.005):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        self.server = None
+
+    async def best_move(self, position):
+        if self.server is None:
+            self.server = asyncio.create_task(self.serve())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((position, future))
+        return await future
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch and loop.time() < deadline:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+
+            # A malformed position fails only its own request, best_moves would fail the whole batch
+            valid = []
+            for position, future in batch:
+                try:
+                    self.engine.board.parse(position)
+                except ValueError as error:
+                    if not future.done():
+                        future.set_exception(error)
+                else:
+                    valid.append((position, future))
+            batch = valid
+            if not batch:
+                continue
+
+            # The search runs in a thread so the event loop keeps accepting requests
+            try:
+                moves = await loop.run_in_executor(None, self.engine.best_moves, [position for position, _ in batch])
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for (_, future), move in zip(batch, moves):
+                if not future.done():
+                    future.set_result(move)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.cancel()
+            try:
+                await self.server
+            except asyncio.CancelledError:
+                pass
+            self.server = None
+        self.engine.close()
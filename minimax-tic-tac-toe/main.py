@@ -1,11 +1,27 @@
+import argparse
+
+import tablebase
 from minimax import Game
 
 
 def main():
-    game = Game(algorithm='minimax')
-    game.run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--algorithm', choices=['minimax', 'alpha-beta', 'pvs', 'iterative-deepening', 'parallel-alpha-beta', 'tablebase'], default='minimax')
+    parser.add_argument('--rows', type=int, default=3)
+    parser.add_argument('--cols', type=int, default=3)
+    parser.add_argument('--k', type=int, default=3, help="marks in a row needed to win")
+    parser.add_argument('--time-limit', type=float, default=1.0, help="seconds per move for iterative deepening")
+    parser.add_argument('--workers', type=int, help="processes for parallel-alpha-beta, all cores by default")
+    parser.add_argument('--rebuild', action='store_true', help="regenerate the tablebase file")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        tablebase.build()
+    # The process pool and the tablebase are released even if the game fails
+    with Game(algorithm=args.algorithm, rows=args.rows, cols=args.cols, k=args.k, time_limit=args.time_limit, workers=args.workers) as game:
+        game.run()
     game.plot_times()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,19 +1,21 @@
-import numpy as np
 import matplotlib.pyplot as plt
 import random
 import time
 
+from engine import Engine
 
-class Game():
-    def __init__(self, algorithm='minimax'):
-        self.algorithm = algorithm
-        self.board = [[' ' for _ in range(3)] for _ in range(3)]
+
+class Game(Engine):
+    def __init__(self, algorithm='minimax', rows=3, cols=3, k=3, time_limit=1.0, table_size=100_000, workers=None):
+        super().__init__(algorithm, rows, cols, k, time_limit, table_size, workers)
         self.times = []
+        self.depths = []
+        self.speeds = []
 
     def show_board(self):
-        for ix, row in enumerate(self.board):
+        for ix, row in enumerate(self.board.grid()):
             print('|'.join(row))
-            print('-' * 5) if ix < 2 else None
+            print('-' * (2 * self.board.cols - 1)) if ix < self.board.rows - 1 else None
 
     def chose_side(self):
         choice = ''
@@ -29,17 +31,12 @@ class Game():
                 print("Invalid choice")
 
     def moves_left(self):
-        amount = 0
-        for row in self.board:
-            for cell in row:
-                if cell == ' ':
-                    amount += 1
-        return amount
+        return self.board.moves_left()
 
     def player_move(self):
         row, col = map(int, input("Your move: ").split())
-        if self.board[row][col] == ' ':
-            self.board[row][col] = self.player
+        if self.board.is_free(row, col):
+            self.board.place(self.player, row, col)
         else:
             print("Invalid move")
             self.player_move()
@@ -47,23 +44,23 @@ class Game():
 
     def ai_move(self):
         print("AI's move:", end=' ')
-        if self.moves_left() == 9:
-            best_start_moves = [(0, 0), (0, 2), (2, 0), (2, 2)]
+        if self.moves_left() == self.board.cells and self.algorithm in ('minimax', 'alpha-beta', 'pvs'):
+            last_row, last_col = self.board.rows - 1, self.board.cols - 1
+            best_start_moves = [(0, 0), (0, last_col), (last_row, 0), (last_row, last_col)]
             row, col = random.choice(best_start_moves)
         else:
-            match self.algorithm:
-                case 'minimax':
-                    start_time = time.perf_counter()
-                    row, col = self.minimax(self.board, True)['pos']
-                    end_time = time.perf_counter()
-                case 'alpha-beta':
-                    start_time = time.perf_counter()
-                    row, col = self.alpha_beta(self.board, -np.inf, np.inf, True)['pos']
-                    end_time = time.perf_counter()
+            start_time = time.perf_counter()
+            best = self.search()
+            end_time = time.perf_counter()
+            row, col = best['pos']
             duration = end_time - start_time
             self.times.append(duration)
             print(f"Time: {duration:.2f}s")
-        self.board[row][col] = self.ai
+            if self.algorithm in ('iterative-deepening', 'parallel-alpha-beta'):
+                self.depths.append(best['depth'])
+                self.speeds.append(self.nodes / duration)
+                print(f"Depth: {best['depth']}, nodes/s: {self.speeds[-1]:.0f}")
+        self.board.place(self.ai, row, col)
         print(f"{row} {col}")
         self.show_board()
 
@@ -79,98 +76,23 @@ class Game():
                 plt.title('Minimax')
             case 'alpha-beta':
                 plt.title('Alpha-Beta')
+            case 'pvs':
+                plt.title('Principal Variation Search')
+            case 'iterative-deepening':
+                plt.title('Iterative Deepening')
+            case 'parallel-alpha-beta':
+                plt.title(f'Parallel Alpha-Beta ({self.workers} workers)')
+            case 'tablebase':
+                plt.title('Tablebase')
         for i, time in enumerate(self.times):
             plt.text(x[i], time, str(round(time, 6)), ha='center', va='bottom')
         plt.show()
 
-    def minimax(self, board, move_max):
-        if self.check_winner(self.player):
-            return {"pos": None, "score": -1 * (self.moves_left() + 1)}
-        if self.check_winner(self.ai):
-            return {"pos": None, "score": 1 * (self.moves_left() + 1)}
-        if self.check_draw():
-            return {"pos": None, "score": 0}
-        
-        if move_max:
-            best = {"pos": None, "score": -np.inf}
-            for row in range(3):
-                for col in range(3):
-                    if board[row][col] == ' ':
-                        board[row][col] = self.ai
-                        current = self.minimax(board, not move_max)
-                        if current['score'] > best['score']:
-                            best = {"pos": (row, col), "score": current["score"]}
-                        board[row][col] = ' '
-        
-        else:
-            best = {"pos": None, "score": np.inf}
-            for row in range(3):
-                for col in range(3):
-                    if board[row][col] == ' ':
-                        board[row][col] = self.player
-                        current = self.minimax(board, not move_max)
-                        if current['score'] < best['score']:
-                            best = {"pos": (row, col), "score": current["score"]}
-                        board[row][col] = ' '
-        
-        return best
-    
-    def alpha_beta(self, board, alpha, beta, move_max):
-        if self.check_winner(self.player):
-            return {"pos": None, "score": -1 * (self.moves_left() + 1)}
-        if self.check_winner(self.ai):
-            return {"pos": None, "score": 1 * (self.moves_left() + 1)}
-        if self.check_draw():
-            return {"pos": None, "score": 0}
-        
-        if move_max:
-            best = {"pos": None, "score": -np.inf}
-            for row in range(3):
-                for col in range(3):
-                    if board[row][col] == ' ':
-                        board[row][col] = self.ai
-                        current = self.alpha_beta(board, alpha, beta, not move_max)
-                        if current['score'] > best['score']:
-                            best = {"pos": (row, col), "score": current["score"]}
-                        board[row][col] = ' '
-                        alpha = max(best['score'], beta)
-                        if beta <= alpha:
-                            continue
-        
-        else:
-            best = {"pos": None, "score": np.inf}
-            for row in range(3):
-                for col in range(3):
-                    if board[row][col] == ' ':
-                        board[row][col] = self.player
-                        current = self.alpha_beta(board, alpha, beta, not move_max)
-                        if current['score'] < best['score']:
-                            best = {"pos": (row, col), "score": current["score"]}
-                        board[row][col] = ' '
-                        beta = min(best['score'], beta)
-                        if beta <= alpha:
-                            continue
-        
-        return best
-
     def check_winner(self, mark):
-        # Check rows
-        for row in self.board:
-            if row.count(mark) == 3:
-                return True
-        # Check columns
-        for col in range(3):
-            if [self.board[row][col] for row in range(3)].count(mark) == 3:
-                return True
-        # Check diagonals
-        if [self.board[i][i] for i in range(3)].count(mark) == 3:
-            return True
-        if [self.board[i][2 - i] for i in range(3)].count(mark) == 3:
-            return True
-        return False
-    
+        return self.board.check_winner(mark)
+
     def check_draw(self):
-        return all([cell != ' ' for row in self.board for cell in row])
+        return self.board.check_draw()
 
     def start_game(self):
         while True:
@@ -201,9 +123,11 @@ class Game():
 
     def run(self):
         self.times = []
+        self.depths = []
+        self.speeds = []
         self.chose_side()
         self.show_board()
-        print("Rows and columns are indexed from 0 to 2. For example:")
-        print("To select the middle left cell, type: 1 0")
+        print(f"Rows are indexed from 0 to {self.board.rows - 1} and columns from 0 to {self.board.cols - 1}. For example:")
+        print(f"To select the middle left cell, type: {self.board.rows // 2} 0")
         input("Press Enter to play...")
-        self.start_game()
\ No newline at end of file
+        self.start_game()
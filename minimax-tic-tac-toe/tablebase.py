@@ -0,0 +1,100 @@
+import mmap
+import os
+import struct
+import zlib
+
+from board import Board
+
+BOARD = Board()
+CELLS = BOARD.cells
+FULL = BOARD.full
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebase.bin')
+
+MAGIC = b'TTTB'
+VERSION = 1
+# magic, version, cells, entries, crc32 of the entries
+HEADER = struct.Struct('<4sHHII')
+ENTRIES = 3 ** CELLS
+NO_MOVE = -1
+
+# Position index is the base-3 number with digit 1 for 'x' and 2 for 'o'
+TERNARY = tuple(
+    sum(3 ** cell for cell in range(CELLS) if mask >> cell & 1)
+    for mask in range(FULL + 1)
+)
+
+
+def index(x, o):
+    return TERNARY[x] + 2 * TERNARY[o]
+
+
+def solve(me, them, x_to_move, data):
+    # Scores are from the point of view of the side to move, same scale as Game.minimax
+    empty = FULL & ~(me | them)
+    i = index(me, them) if x_to_move else index(them, me)
+    if data[i] is not None:
+        return data[i][1]
+
+    if BOARD.winning(them):
+        best_move, best = NO_MOVE, -1 * (empty.bit_count() + 1)
+    elif not empty:
+        best_move, best = NO_MOVE, 0
+    else:
+        best_move, best = NO_MOVE, -CELLS - 2
+        while empty:
+            move = empty & -empty
+            empty ^= move
+            score = -solve(them, me | move, not x_to_move, data)
+            if score > best:
+                best_move, best = move.bit_length() - 1, score
+
+    data[i] = (best_move, best)
+    return best
+
+
+def build(path=PATH):
+    solved = [None] * ENTRIES
+    solve(0, 0, True, solved)
+
+    # Unreachable positions keep an empty entry
+    entries = bytearray(2 * ENTRIES)
+    for i, entry in enumerate(solved):
+        move, score = entry if entry is not None else (NO_MOVE, 0)
+        struct.pack_into('<bb', entries, 2 * i, move, score)
+
+    header = HEADER.pack(MAGIC, VERSION, CELLS, ENTRIES, zlib.crc32(entries))
+    with open(path + '.tmp', 'wb') as file:
+        file.write(header)
+        file.write(entries)
+    os.replace(path + '.tmp', path)
+
+
+class Tablebase():
+    def __init__(self, path=PATH):
+        with open(path, 'rb') as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.mmap) != HEADER.size + 2 * ENTRIES:
+            raise ValueError(f"Tablebase {path} has a wrong size, run with --rebuild")
+        magic, version, cells, entries, crc = HEADER.unpack_from(self.mmap)
+        if (magic, version, cells, entries) != (MAGIC, VERSION, CELLS, ENTRIES):
+            raise ValueError(f"Tablebase {path} has an unknown format, run with --rebuild")
+        self.entries = memoryview(self.mmap)[HEADER.size:].cast('b')
+        if zlib.crc32(self.entries) != crc:
+            raise ValueError(f"Tablebase {path} is corrupted, run with --rebuild")
+
+    def close(self):
+        # The view has to be released before the mapping can be closed
+        self.entries.release()
+        self.mmap.close()
+
+    def best_move(self, x, o):
+        i = 2 * index(x, o)
+        return self.entries[i], self.entries[i + 1]
+
+
+def load(path=PATH, rebuild=False):
+    if rebuild or not os.path.exists(path):
+        build(path)
+    return Tablebase(path)
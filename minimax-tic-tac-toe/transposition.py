@@ -0,0 +1,37 @@
+from collections import OrderedDict
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class TranspositionTable():
+    def __init__(self, max_size=100_000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def store(self, key, score, flag, depth):
+        self.entries[key] = (score, flag, depth)
+        self.entries.move_to_end(key)
+        # Evict the least recently used entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,102 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from main import data_parallel_model, predict, score
+from utils import InferenceEngine, initialize_parameters_deep, load_data_cached, load_model
+
+
+def training_scaling(args, train_x, train_y, test_x, test_y):
+    # Images per second of data-parallel training for every number of workers
+    layers_dims = (train_x.shape[1], args.hidden, 1)
+    images = (len(train_x) // args.batch_size) * args.batch_size * args.epochs
+    results = []
+    for workers in args.workers:
+        start_time = time.perf_counter()
+        parameters = data_parallel_model(
+            train_x, train_y, layers_dims,
+            learning_rate=args.learning_rate,
+            num_iterations=args.epochs,
+            batch_size=args.batch_size,
+            workers=workers,
+        )
+        elapsed = time.perf_counter() - start_time
+        results.append({
+            'workers': workers,
+            'time': elapsed,
+            'images_per_second': images / elapsed,
+            'test_accuracy': score(test_y, predict(test_x.T / 255, parameters)),
+        })
+    return results
+
+
+def print_scaling(results):
+    print(f"{'workers':>8} {'time (s)':>10} {'images/s':>10} {'speedup':>8} {'test acc':>9}")
+    for result in results:
+        speedup = results[0]['time'] / result['time']
+        print(
+            f"{result['workers']:>8} {result['time']:>10.2f} {result['images_per_second']:>10.0f}"
+            f" {speedup:>8.2f} {result['test_accuracy']:>9.2%}"
+        )
+
+
+def inference(args, images):
+    # Throughput of the engine for every batch size, and latency of a single batch
+    if os.path.exists(args.model):
+        _, parameters, layers_dims = load_model(args.model)
+    else:
+        layers_dims = (images.shape[1], args.hidden, 1)
+        _, parameters = initialize_parameters_deep(layers_dims)
+    print(f"{len(images)} images, layers {layers_dims}")
+    print(f"{'batch':>8} {'images/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+
+    start_time = time.perf_counter()
+    predict(images.T / 255, parameters)
+    elapsed = time.perf_counter() - start_time
+    print(f"{'predict':>8} {len(images) / elapsed:>10.0f}")
+
+    for batch_size in args.batch_sizes:
+        engine = InferenceEngine(parameters, batch_size)
+        out = np.empty(len(images), dtype=np.float32)
+        start_time = time.perf_counter()
+        for _ in range(args.repeat):
+            engine.probabilities(images, out)
+        elapsed = time.perf_counter() - start_time
+
+        latencies = []
+        for start in range(0, len(images) - batch_size + 1, batch_size):
+            batch = images[start:start + batch_size]
+            start_time = time.perf_counter()
+            engine.probabilities(batch, out[:batch_size])
+            latencies.append(time.perf_counter() - start_time)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if latencies else (np.nan, np.nan)
+        print(f"{batch_size:>8} {args.repeat * len(images) / elapsed:>10.0f} {p50:>10.3f} {p99:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the data-parallel training and of the inference")
+    parser.add_argument('--inference', action='store_true', help="benchmark InferenceEngine instead of training")
+    parser.add_argument('--workers', type=int, nargs='+', default=list(range(1, (os.cpu_count() or 1) + 1)))
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=64, help="divisible by every number of workers")
+    parser.add_argument('--hidden', type=int, default=10)
+    parser.add_argument('--learning-rate', type=float, default=0.01)
+    parser.add_argument('--model', default='data/model.bin', help="model for --inference, random weights if missing")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 64, 256])
+    parser.add_argument('--images', type=int, default=4096, help="the training set is repeated up to this many images")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    train_x, train_y, test_x, test_y = load_data_cached()
+    if args.inference:
+        inference(args, np.resize(train_x, (args.images, train_x.shape[1])))
+        return
+
+    print(f"{len(train_x)} training images, {args.epochs} epochs, batch size {args.batch_size}")
+    print_scaling(training_scaling(args, train_x, train_y, test_x, test_y))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import json
+import time
+
+import numpy as np
+
+from utils import InferenceEngine, L_model_cost, cross_entropy_with_logits, save_checkpoint
+
+
+class Callback():
+    """
+    Punkty zaczepienia w pętli L_layer_model. Każda metoda dostaje słownik state z kluczami:
+    "iteration" -- numer iteracji (epoki przy batch_size)
+    "parameters" -- słownik Pythona z W1, b1, ..., WL, bL; widoki na "flat"
+    "flat" -- ciągła tablica wszystkich parametrów
+    "rng" -- np.random.Generator tasujący paczki
+    "AL", "Y" -- wynik sieci i etykiety ostatniej paczki iteracji (None przed pierwszą iteracją)
+    "buffers" -- bufory uczenia z initialize_buffers, po ostatniej paczce iteracji
+    "timings" -- sekundy spędzone w iteracji na "data", "forward", "backward" i "update"
+    "metrics" -- słownik wartości zapisanych w tej iteracji przez wywołania zwrotne
+    "stop" -- ustawienie na True kończy trening po bieżącej iteracji
+    """
+
+    def on_train_begin(self, state):
+        pass
+
+    def on_iteration_end(self, state):
+        pass
+
+    def on_train_end(self, state):
+        pass
+
+
+class Timer(Callback):
+    """
+    Sumuje czasy faz uczenia i wypisuje je na koniec treningu.
+    """
+
+    def on_train_begin(self, state):
+        self.totals = dict.fromkeys(state["timings"], 0.0)
+
+    def on_iteration_end(self, state):
+        for phase, seconds in state["timings"].items():
+            self.totals[phase] += seconds
+
+    def on_train_end(self, state):
+        total = sum(self.totals.values())
+        for phase, seconds in self.totals.items():
+            print(f"{phase:>8}: {seconds:8.3f} s ({seconds / total if total else 0:.0%})")
+
+
+class Validation(Callback):
+    """
+    Co interval iteracji zapisuje koszt ostatniej paczki oraz koszt i dokładność na zbiorze
+    walidacyjnym (części zbioru treningowego, np. z validation_split, nie zbiorze testowym). Przy
+    patience kończy trening, gdy monitorowana wartość nie poprawiła się o więcej niż min_delta przez
+    patience kolejnych pomiarów, i przywraca wtedy najlepsze parametry. Pomiary z pierwszych warmup
+    iteracji są tylko zapisywane: na początku treningu sieć przewiduje zwykle jedną klasę i ani nie
+    liczą się do patience, ani nie mogą zostać najlepszymi parametrami.
+    Po wznowieniu z punktu kontrolnego licznik pomiarów zaczyna się od zera.
+
+    Argumenty:
+    X -- przykłady walidacyjne w wierszach, kształt (liczba przykładów, ...), np. np.memmap z load_data_cached
+    Y -- etykiety walidacyjne, kształt (liczba przykładów,)
+    interval -- co ile iteracji mierzyć
+    patience -- liczba pomiarów bez poprawy, po której trening jest przerywany; None wyłącza
+    min_delta -- minimalna zmiana monitorowanej wartości uznawana za poprawę
+    scale -- mnożnik normalizujący X, ten sam co scale w L_layer_model
+    monitor -- "val_cost" (poprawa to spadek) lub "val_accuracy" (poprawa to wzrost)
+    warmup -- liczba początkowych iteracji, których pomiary nie są brane pod uwagę przy patience
+    """
+
+    MONITORS = {"val_cost": -1, "val_accuracy": 1}
+
+    def __init__(self, X, Y, interval=10, patience=None, min_delta=0.0, scale=1 / 255, monitor="val_cost", warmup=0):
+        if monitor not in self.MONITORS:
+            raise ValueError(f"monitor must be one of {sorted(self.MONITORS)}, got {monitor!r}")
+        self.X = X
+        self.Y = np.asarray(Y).reshape(1, -1)
+        self.interval = interval
+        self.patience = patience
+        self.min_delta = min_delta
+        self.scale = scale
+        self.monitor = monitor
+        self.warmup = warmup
+
+    def on_train_begin(self, state):
+        self.best = -np.inf
+        self.best_flat = None
+        self.stalled = 0
+
+    def on_iteration_end(self, state):
+        if state["iteration"] % self.interval:
+            return
+
+        engine = InferenceEngine(state["parameters"], scale=self.scale, dtype=state["flat"].dtype)
+        Z = engine.logits(self.X).reshape(1, -1)
+        state["metrics"].update(
+            cost=L_model_cost(state["Y"], state["buffers"]),
+            val_cost=cross_entropy_with_logits(Z, self.Y),
+            val_accuracy=float(np.mean((Z > 0) == self.Y)),
+        )
+
+        if state["iteration"] < self.warmup:
+            return
+        # Compared with the sign flipped for the cost, so that greater is always better
+        value = self.MONITORS[self.monitor] * state["metrics"][self.monitor]
+        if value > self.best + self.min_delta:
+            self.best, self.stalled = value, 0
+            if self.patience is not None:
+                self.best_flat = state["flat"].copy()
+        else:
+            self.stalled += 1
+            if self.patience is not None and self.stalled >= self.patience:
+                state["flat"][...] = self.best_flat
+                state["stop"] = True
+
+
+class Checkpoint(Callback):
+    """
+    Co interval iteracji i na koniec treningu zapisuje punkt kontrolny (save_checkpoint),
+    z którego L_layer_model(..., resume=path) wznawia trening.
+
+    Argumenty:
+    path -- ścieżka do pliku .npz
+    interval -- co ile iteracji zapisywać
+    """
+
+    def __init__(self, path, interval=100):
+        self.path = path
+        self.interval = interval
+
+    def on_iteration_end(self, state):
+        if (state["iteration"] + 1) % self.interval == 0:
+            save_checkpoint(self.path, state["flat"], state["rng"], state["iteration"])
+
+    def on_train_end(self, state):
+        save_checkpoint(self.path, state["flat"], state["rng"], state["iteration"])
+
+
+class JsonLog(Callback):
+    """
+    Dopisuje do pliku jeden wiersz JSON na iterację: numer iteracji, czasy faz i wartości
+    zapisane przez wcześniejsze wywołania zwrotne (musi być na liście za nimi).
+
+    Argumenty:
+    path -- ścieżka do pliku z logiem
+    interval -- co ile iteracji zapisywać
+    """
+
+    def __init__(self, path, interval=1):
+        self.path = path
+        self.interval = interval
+
+    def on_train_begin(self, state):
+        # Line buffered, so the log is complete up to the last iteration even if training crashes
+        self.file = open(self.path, 'a', buffering=1)
+
+    def on_iteration_end(self, state):
+        if state["iteration"] % self.interval == 0 or state["metrics"]:
+            record = {"iteration": state["iteration"], "time": time.time(), **state["timings"], **state["metrics"]}
+            self.file.write(json.dumps(record) + '\n')
+
+    def on_train_end(self, state):
+        self.file.close()
@@ -1,71 +1,248 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from utils import *
+from callbacks import Checkpoint, JsonLog, Timer, Validation
 
 
-def two_layer_model(X, Y, layers_dims, learning_rate=0.0001, num_iterations=3000, print_cost=False):
+def L_layer_model(X, Y, layers_dims, learning_rate=0.0001, num_iterations=3000, print_cost=False, dtype=np.float32,
+                  batch_size=None, seed=1, prefetch_batches=2, callbacks=(), resume=None, scale=1 / 255):
     """
-    Implementacja dwuwarstwej siecu neuronoweh:
-    
+    Implementacja L-warstwowej sieci neuronowej: [LINEAR -> RELU] * (L-1) -> LINEAR -> SIGMOID.
+    Parametry i gradienty są trzymane w dwóch ciągłych tablicach, aktualizowanych w miejscu.
+
     Argumenty:
-    X -- dane wejściowe, kształt 
-    Y -- wektor prawdziwych etykiet ( 1 - 'kot', 0 - 'nie-kot'),
-    layers_dims -- wymiary warstw
-    num_iterations -- liczba iteracji 
-    learning_rate -- współczynnik uczenia się 
-    
+    X -- nieznormalizowane dane wejściowe, kształt (n_x, liczba przykładów); przy batch_size przykłady
+         w wierszach, kształt (liczba przykładów, ...): zbiór HDF5, np.memmap z load_data_cached albo X.T
+    Y -- wektor prawdziwych etykiet ( 1 - 'kot', 0 - 'nie-kot'), kształt (1, liczba przykładów);
+         przy batch_size kształt (liczba przykładów,)
+    layers_dims -- wymiary warstw (n_x, n_h1, ..., n_y)
+    learning_rate -- współczynnik uczenia się
+    num_iterations -- liczba iteracji; przy batch_size liczba epok
+    print_cost -- czy wypisywać koszt co 100 iteracji
+    dtype -- typ danych obliczeń (np.float32 lub np.float64)
+    batch_size -- None dla gradientu z całego zbioru, inaczej rozmiar paczki w SGD; paczki są
+                  tasowane i czytane w wątku w tle
+    seed -- ziarno tasowania paczek
+    prefetch_batches -- ile paczek czytać na zapas
+    callbacks -- lista obiektów Callback (callbacks.py), wywoływanych w tej kolejności po każdej iteracji
+    resume -- ścieżka do punktu kontrolnego (Checkpoint); jeśli plik istnieje, trening jest kontynuowany
+              od następnej iteracji
+    scale -- mnożnik normalizujący X, ten sam dla całego zbioru i dla paczek (1 dla już znormalizowanych danych)
+
     Zwraca:
-    parameters -- słownik zawierający W1, W2, b1, b2
+    parameters -- słownik zawierający W1, b1, ..., WL, bL
     """
-    
-    np.random.seed(1)
-    grads = {}
-    costs = []  # to keep track of the cost
-    m = X.shape[1]  # number of examples
-    (n_x, n_h, n_y) = layers_dims
-    
-    # Initialize parameters dictionary
-    parameters = initialize_parameters(n_x, n_h, n_y)
-    
-    # Loop (gradient descent)
-    for i in range(num_iterations):
+
+    if batch_size is None:
+        # A new array, the caller's X is never scaled in place
+        X = np.multiply(X, scale, dtype=dtype)
+        Y = np.ascontiguousarray(Y, dtype=dtype)
+    elif batch_size > len(X):
+        raise ValueError(f"batch_size {batch_size} is larger than the {len(X)} training examples")
+    rng = np.random.default_rng(seed)
+
+    # Everything used in the loop is allocated once
+    flat, parameters = initialize_parameters_deep(layers_dims, dtype)
+    buffers = initialize_buffers(layers_dims, X.shape[1] if batch_size is None else batch_size, dtype)
+    layers = layers_of(parameters, buffers["grads"])
+
+    start = 0
+    if resume is not None and os.path.exists(resume):
+        start = load_checkpoint(resume, flat, rng) + 1
+
+    timings = dict.fromkeys(("data", "forward", "backward", "update"), 0.0)
+    state = {
+        "iteration": start - 1, "parameters": parameters, "flat": flat, "buffers": buffers, "rng": rng, "timings": timings,
+        "AL": None, "Y": None, "stop": False,
+    }
+    for callback in callbacks:
+        callback.on_train_begin(state)
+
+    for i in range(start, num_iterations):
 
         if i % 100 == 0:
             print(f"Iteration {i}")
 
-        # Forward propagation: LINEAR -> RELU -> LINEAR -> SIGMOID
-        A1, cache1 = linear_activation_forward(X, parameters["W1"], parameters["b1"], activation="relu")
-        A2, cache2 = linear_activation_forward(A1, parameters["W2"], parameters["b2"], activation="sigmoid")
-        
-        # Compute cost
-        cost = compute_cost(A2, Y)
-        
-        # Initialize backward propagation
-        A2 = np.clip(A2, 1e-10, 1 - 1e-10)
-        dA2 = - (np.divide(Y, A2) - np.divide(1 - Y, 1 - A2))
-        
-        # Backward propagation
-        dA1, dW2, db2 = linear_activation_backward(dA2, cache2, activation="sigmoid")
-        dA0, dW1, db1 = linear_activation_backward(dA1, cache1, activation="relu")
-        
-        # Set grads
-        grads["dW1"] = dW1
-        grads["db1"] = db1
-        grads["dW2"] = dW2
-        grads["db2"] = db2
-        
-        # Update parameters
-        parameters = update_parameters(parameters, grads, learning_rate)
-        
-        # Print the cost every 100 training examples
+        if batch_size is None:
+            batches = [(X, Y)]
+        else:
+            batches = prefetch(minibatches(X, Y, batch_size, rng, scale, dtype), prefetch_batches)
+
+        for phase in timings:
+            timings[phase] = 0.0
+        # Every epoch has at least one batch (checked above), so both are set before they are used
+        AL = Y_batch = None
+        batches = iter(batches)
+        while True:
+            start_time = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                break
+            X_batch, Y_batch = batch
+            forward_time = time.perf_counter()
+            AL = L_model_forward(X_batch, layers, buffers)
+            backward_time = time.perf_counter()
+            grads_flat = L_model_backward(Y_batch, layers, buffers)
+            update_time = time.perf_counter()
+            update_parameters_flat(flat, grads_flat, learning_rate)
+            end_time = time.perf_counter()
+            timings["data"] += forward_time - start_time
+            timings["forward"] += backward_time - forward_time
+            timings["backward"] += update_time - backward_time
+            timings["update"] += end_time - update_time
+
+        # The cost is only needed when it is printed, it is the one of the last batch
         if print_cost and i % 100 == 0:
-            print(f"Cost after iteration {i}: {np.squeeze(cost)}")
-            costs.append(cost)
-    
+            print(f"Cost after iteration {i}: {L_model_cost(Y_batch, buffers)}")
+
+        state.update(iteration=i, AL=AL, Y=Y_batch, metrics={})
+        for callback in callbacks:
+            callback.on_iteration_end(state)
+        if state["stop"]:
+            print(f"Stopped after iteration {i}")
+            break
+
+    for callback in callbacks:
+        callback.on_train_end(state)
+
     return parameters
 
 
+def two_layer_model(X, Y, layers_dims, learning_rate=0.0001, num_iterations=3000, print_cost=False, dtype=np.float32,
+                    batch_size=None, seed=1, prefetch_batches=2, callbacks=(), resume=None, scale=1 / 255):
+    """
+    Implementacja dwuwarstwej sieci neuronowej: LINEAR -> RELU -> LINEAR -> SIGMOID
+
+    Argumenty:
+    X -- nieznormalizowane dane wejściowe, kształt (n_x, liczba przykładów)
+    Y -- wektor prawdziwych etykiet ( 1 - 'kot', 0 - 'nie-kot'),
+    layers_dims -- wymiary warstw (n_x, n_h, n_y)
+    num_iterations -- liczba iteracji
+    learning_rate -- współczynnik uczenia się
+    dtype -- typ danych obliczeń (np.float32 lub np.float64)
+    batch_size -- None dla gradientu z całego zbioru, inaczej rozmiar paczki w SGD (patrz L_layer_model)
+    seed -- ziarno tasowania paczek
+    prefetch_batches -- ile paczek czytać na zapas
+    callbacks -- lista obiektów Callback, np. Timer, Validation, Checkpoint, JsonLog (patrz L_layer_model)
+    resume -- ścieżka do punktu kontrolnego, od którego wznowić trening
+    scale -- mnożnik normalizujący X (patrz L_layer_model)
+
+    Zwraca:
+    parameters -- słownik zawierający W1, W2, b1, b2
+    """
+
+    return L_layer_model(X, Y, layers_dims, learning_rate, num_iterations, print_cost, dtype, batch_size, seed, prefetch_batches,
+                         callbacks, resume, scale)
+
+
+def data_parallel_model(X, Y, layers_dims, learning_rate=0.01, num_iterations=200, print_cost=False, dtype=np.float32,
+                        batch_size=32, seed=1, workers=2, timeout=60.0):
+    """
+    Trening L-warstwowej sieci (jak L_layer_model z batch_size) w kilku procesach. Każda paczka jest
+    dzielona na równe części, procesy liczą z nich gradienty do pamięci współdzielonej, a proces główny
+    uśrednia je i aktualizuje wspólne parametry. Tasowanie zależy tylko od seed i numeru epoki, więc
+    przy tej samej liczbie procesów wynik jest powtarzalny.
+
+    Argumenty:
+    X -- np.memmap z obrazami z load_data_cached, kształt (liczba przykładów, n_x)
+    Y -- np.memmap z etykietami z load_data_cached, kształt (liczba przykładów,)
+    layers_dims -- wymiary warstw (n_x, n_h1, ..., n_y)
+    learning_rate -- współczynnik uczenia się
+    num_iterations -- liczba epok
+    print_cost -- czy wypisywać koszt na całym zbiorze co 100 epok
+    dtype -- typ danych obliczeń (np.float32 lub np.float64)
+    batch_size -- rozmiar paczki, podzielny przez workers
+    seed -- ziarno tasowania paczek
+    workers -- liczba procesów
+    timeout -- ile sekund czekać na pozostałe procesy w jednym kroku, zanim trening zostanie przerwany
+               (np. gdy proces roboczy zginął bez zgłoszenia wyjątku)
+
+    Zwraca:
+    parameters -- słownik zawierający W1, b1, ..., WL, bL
+    """
+
+    if batch_size % workers:
+        raise ValueError(f"batch_size {batch_size} cannot be split between {workers} workers")
+
+    flat, _ = initialize_parameters_deep(layers_dims, dtype)
+    ctype = np.ctypeslib.as_ctypes_type(flat.dtype)
+    parameters_buffer = multiprocessing.RawArray(ctype, flat.size)
+    grads_buffer = multiprocessing.RawArray(ctype, workers * flat.size)
+    shared_flat = np.frombuffer(parameters_buffer, dtype=flat.dtype)
+    shared_flat[:] = flat
+    grads = np.frombuffer(grads_buffer, dtype=flat.dtype).reshape(workers, flat.size)
+    average = np.empty_like(shared_flat)
+    barrier = multiprocessing.Barrier(workers + 1, timeout=timeout)
+    steps = len(X) // batch_size
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_data_parallel_worker,
+        initargs=(barrier, parameters_buffer, grads_buffer, flat.dtype),
+    ) as executor:
+        futures = [
+            executor.submit(train_shard, worker, X.filename, Y.filename, layers_dims, num_iterations, batch_size, seed)
+            for worker in range(workers)
+        ]
+        try:
+            for i in range(num_iterations):
+
+                if i % 100 == 0:
+                    print(f"Iteration {i}")
+
+                for step in range(steps):
+                    barrier.wait()
+                    np.mean(grads, axis=0, out=average)
+                    update_parameters_flat(shared_flat, average, learning_rate)
+                    barrier.wait()
+
+                if print_cost and i % 100 == 0:
+                    parameters = parameters_from_flat(shared_flat, layers_dims)
+                    print(f"Cost after iteration {i}: {compute_cost(forward(X.T / 255, parameters), Y.reshape(1, -1))}")
+        except threading.BrokenBarrierError:
+            # A worker failed or stopped responding, its exception says why; the others only
+            # report the broken barrier
+            barrier.abort()
+            wait(futures)
+            for future in futures:
+                if not isinstance(future.exception(), (type(None), threading.BrokenBarrierError)):
+                    future.result()
+            raise
+        finally:
+            # Whatever stopped the loop, no worker may stay blocked on the barrier, or leaving the
+            # executor would wait for it forever
+            barrier.abort()
+
+    return parameters_from_flat(shared_flat.copy(), layers_dims)
+
+
+def forward(X, parameters):
+    """
+    Argumenty:
+    X -- dane wejściowe, kształt (n_x, liczba przykładów)
+    parameters -- słownik zawierający W1, b1, ..., WL, bL
+
+    Zwraca:
+    A -- prawdopodobieństwa z ostatniej warstwy, kształt (1, liczba przykładów)
+    """
+
+    L = len(parameters) // 2
+    A = X
+    for l in range(1, L + 1):
+        activation = "relu" if l < L else "sigmoid"
+        A, cache = linear_activation_forward(A, parameters["W" + str(l)], parameters["b" + str(l)], activation=activation)
+
+    return A
+
+
 def predict(X, parameters):
     """
     Using the learned parameters, predicts a class for each example in X
@@ -79,9 +256,7 @@ def predict(X, parameters):
     """
     
     # Computes probabilities using forward propagation, and classifies to 0/1 using 0.5 as the threshold.
-    A2, cache = linear_activation_forward(X, parameters["W1"], parameters["b1"], activation="relu")
-    A2, cache = linear_activation_forward(A2, parameters["W2"], parameters["b2"], activation="sigmoid")
-    predictions = (A2 > 0.5).flatten()
+    predictions = (forward(X, parameters) > 0.5).flatten()
     
     return predictions
 
@@ -90,27 +265,60 @@ def score(y_true, y_pred):
 
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='data/model.bin', help="trained model, created on the first run")
+    parser.add_argument('--retrain', action='store_true', help="train again even if the model exists")
+    parser.add_argument('--log', help="append the timings, costs and validation accuracy of every epoch to this JSON lines file")
+    parser.add_argument('--checkpoint', help="save the training state every 50 epochs, resume from it if it exists")
+    parser.add_argument('--patience', type=int, help="stop after this many evaluations without the validation metric improving")
+    parser.add_argument('--monitor', default='val_cost', choices=['val_cost', 'val_accuracy'], help="metric watched by --patience")
+    parser.add_argument('--warmup', type=int, default=100, help="epochs before --patience starts counting")
+    args = parser.parse_args()
+
     np.random.seed(1)
-    train_x_orig, train_y, test_x_orig, test_y, classes = load_data()
-
-    print(train_x_orig.shape)
-
-    n_x = train_x_orig.shape[0]
-    n_h = 10
-    n_y = 1
-    layers_dims = (n_x, n_h, n_y)
-
-    parameters = two_layer_model(
-        train_x_orig,
-        train_y,
-        layers_dims,
-        learning_rate=0.0001,
-        num_iterations=2200,
-        print_cost=True
-    )
-
-    predictions_train = predict(train_x_orig, parameters)
-    predictions_test = predict(test_x_orig, parameters)
+    # Examples are rows of memory-mapped arrays, training reads them in mini-batches
+    train_x_rows, train_y, test_x_rows, test_y = load_data_cached()
+
+    print(train_x_rows.shape)
+
+    if args.retrain or not os.path.exists(args.model):
+        n_x = train_x_rows.shape[1]
+        n_h = 10
+        n_y = 1
+        layers_dims = (n_x, n_h, n_y)
+
+        # Early stopping watches a part of the training set, the test set stays unseen until the end
+        train_indices, val_indices = validation_split(len(train_y))
+        validation = Validation(
+            train_x_rows[val_indices], train_y[val_indices], interval=10, patience=args.patience,
+            monitor=args.monitor, warmup=args.warmup,
+        )
+        callbacks = [Timer(), validation]
+        if args.checkpoint:
+            callbacks.append(Checkpoint(args.checkpoint, interval=50))
+        if args.log:
+            callbacks.append(JsonLog(args.log))
+
+        parameters = two_layer_model(
+            train_x_rows[train_indices],
+            train_y[train_indices],
+            layers_dims,
+            learning_rate=0.01,
+            num_iterations=200,
+            print_cost=True,
+            batch_size=32,
+            callbacks=callbacks,
+            resume=args.checkpoint
+        )
+        save_model(args.model, parameters)
+
+    _, parameters, layers_dims = load_model(args.model)
+    print(f"Model {args.model}: layers {layers_dims}")
+
+    # The engine takes the raw uint8 rows, the normalization is folded into W1
+    engine = InferenceEngine(parameters)
+    predictions_train = engine.predict(train_x_rows)
+    predictions_test = engine.predict(test_x_rows)
 
     predictions_train_df = pd.DataFrame({
         "train_y": train_y.flatten(),
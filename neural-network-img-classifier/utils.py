@@ -1,3 +1,10 @@
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+
 import numpy as np
 import h5py
 
@@ -9,13 +16,31 @@ def sigmoid(Z):
 
     Zwraca:
     A -- wynik funkcji sigmoid(z), taki sam kształt jak Z
-    cache -- zwraca również Z, przydatne podczas propagacji wstecznej
+    cache -- słownik pythona zawierający "A"; sigmoid_backward liczy pochodną z A, bez ponownego exp
     """
-    A = 1 / (1 + np.exp(-Z))
-    cache = Z
+    A = stable_sigmoid(Z)
+    cache = {"A": A}
     return A, cache
 
 
+def stable_sigmoid(Z, out=None):
+    """
+    sigmoid(z) = (1 + tanh(z / 2)) / 2: bez exp(-z), który przepełnia się dla dużych ujemnych z.
+
+    Argumenty:
+    Z -- tablica numpy o dowolnym kształcie
+    out -- opcjonalna tablica na wynik (może być samym Z)
+
+    Zwraca:
+    A -- wynik funkcji sigmoid(z), taki sam kształt jak Z
+    """
+    A = np.multiply(Z, 0.5, out=out)
+    np.tanh(A, out=A)
+    A += 1
+    A *= 0.5
+    return A
+
+
 def relu(Z):
     """
     Argumenty:
@@ -35,14 +60,13 @@ def relu_backward(dA, cache):
     """
     Argumenty:
     dA -- gradient po aktywacji, dowolny kształt
-    cache -- 'Z', przechowywane dla efektywnego obliczania propagacji wstecznej
+    cache -- słownik "A" z relu; A > 0 dokładnie tam, gdzie Z > 0
 
     Zwraca:
     dZ -- Gradient kosztu względem Z
     """
 
-    Z = cache  # In activation_cache, we have stored Z
-    dZ = np.array(dA, copy=True)  # just converting dA to a correct object.
+    dZ = dA * (cache["A"] > 0)
 
     return dZ
 
@@ -51,14 +75,13 @@ def sigmoid_backward(dA, cache):
     """
     Argumenty:
     dA -- gradient po aktywacji, dowolny kształt
-    cache -- 'Z', przechowywane dla efektywnego obliczania propagacji wstecznej
+    cache -- słownik "A" z sigmoid, wynik propagacji wprzód
 
     Zwraca:
     dZ -- Gradient kosztu względem Z
     """
 
-    Z = cache  # In activation_cache, we have stored Z
-    s = 1 / (1 + np.exp(-Z))
+    s = cache["A"]
     dZ = dA * s * (1 - s)
 
     return dZ
@@ -179,10 +202,12 @@ def compute_cost(AL, Y):
 
     m = Y.shape[1]  # number of examples
 
-    AL = np.clip(AL, 1e-10, 1 - 1e-10)
+    # Etykiety są 0 lub 1, więc z dwóch logarytmów potrzebny jest tylko jeden: log(AL) albo log(1 - AL)
+    P = np.where(Y == 1, AL, 1 - AL)
+    np.clip(P, 1e-10, None, out=P)
 
     # Compute the cross-entropy cost
-    cost = -1/m * np.sum(Y * np.log(AL) + (1 - Y) * np.log(1 - AL))
+    cost = -1/m * np.sum(np.log(P, out=P))
 
     cost = np.squeeze(cost)  # Ensures cost is a scalar (not an array with one element)
     assert(cost.shape == ()), "The cost should be a scalar"
@@ -190,6 +215,32 @@ def compute_cost(AL, Y):
     return cost
 
 
+def cross_entropy_with_logits(Z, Y, work=None):
+    """
+    Koszt entropii krzyżowej liczony z wartości przed sigmoidem, stabilnie dla dowolnie dużych |Z|:
+    -y log(sigmoid(z)) - (1 - y) log(1 - sigmoid(z)) = max(z, 0) - z y + log(1 + exp(-|z|))
+
+    Argumenty:
+    Z -- wynik warstwy liniowej ostatniej warstwy, kształt (1, liczba przykładów)
+    Y -- prawdziwy wektor etykiet, kształt (1, liczba przykładów)
+    work -- opcjonalny bufor o kształcie Z na obliczenia pośrednie
+
+    Zwraca:
+    cost -- koszt entropii krzyżowej
+    """
+
+    m = Y.shape[1]
+    work = np.abs(Z, out=work)
+    np.negative(work, out=work)
+    np.exp(work, out=work)
+    np.log1p(work, out=work)
+    cost = np.sum(work)
+    np.maximum(Z, 0, out=work)
+    cost += np.sum(work) - np.vdot(Z, Y)
+
+    return float(cost / m)
+
+
 def linear_backward(dZ, cache):
     """
     Argumenty:
@@ -259,3 +310,642 @@ def update_parameters(parameters, grads, learning_rate):
         parameters["b" + str(l)] -= learning_rate * grads["db" + str(l)]
     
     return parameters
+
+
+def parameter_shapes(layers_dims):
+    """
+    Argumenty:
+    layers_dims -- rozmiary kolejnych warstw (n_x, n_h1, ..., n_y)
+
+    Zwraca:
+    shapes -- kształty W1, b1, ..., WL, bL w kolejności, w jakiej leżą w ciągłej tablicy parametrów
+    """
+
+    shapes = []
+    for l in range(1, len(layers_dims)):
+        shapes += [(layers_dims[l], layers_dims[l - 1]), (layers_dims[l], 1)]
+
+    return shapes
+
+
+def flat_views(shapes, dtype=np.float32, flat=None):
+    """
+    Argumenty:
+    shapes -- lista kształtów tablic
+    dtype -- typ danych (np.float32 lub np.float64)
+    flat -- opcjonalna istniejąca tablica (np. w pamięci współdzielonej), inaczej alokowana nowa
+
+    Zwraca:
+    flat -- jedna ciągła tablica numpy mieszcząca wszystkie tablice
+    views -- lista widoków na flat o podanych kształtach
+    """
+
+    if flat is None:
+        flat = np.zeros(sum(int(np.prod(shape)) for shape in shapes), dtype=dtype)
+    views = []
+    offset = 0
+    for shape in shapes:
+        size = int(np.prod(shape))
+        views.append(flat[offset:offset + size].reshape(shape))
+        offset += size
+
+    return flat, views
+
+
+def parameters_from_flat(flat, layers_dims, prefix=""):
+    """
+    Argumenty:
+    flat -- ciągła tablica parametrów (lub gradientów)
+    layers_dims -- rozmiary kolejnych warstw (n_x, n_h1, ..., n_y)
+    prefix -- "" dla parametrów, "d" dla gradientów
+
+    Zwraca:
+    parameters -- słownik Pythona z W1, b1, ..., WL, bL (lub dW1, db1, ...); widoki na flat
+    """
+
+    flat, views = flat_views(parameter_shapes(layers_dims), flat.dtype, flat)
+    parameters = {}
+    for l in range(1, len(layers_dims)):
+        parameters[prefix + "W" + str(l)] = views[2 * l - 2]
+        parameters[prefix + "b" + str(l)] = views[2 * l - 1]
+
+    return parameters
+
+
+def initialize_parameters_deep(layers_dims, dtype=np.float32):
+    """
+    Argumenty:
+    layers_dims -- rozmiary kolejnych warstw (n_x, n_h1, ..., n_y)
+    dtype -- typ danych parametrów (np.float32 lub np.float64)
+
+    Zwraca:
+    flat -- ciągła tablica numpy ze wszystkimi parametrami
+    parameters -- słownik Pythona z W1, b1, ..., WL, bL; widoki na flat, więc zmiana flat zmienia parametry
+    """
+
+    np.random.seed(1)
+
+    flat, _ = flat_views(parameter_shapes(layers_dims), dtype)
+    parameters = parameters_from_flat(flat, layers_dims)
+    for l in range(1, len(layers_dims)):
+        W = parameters["W" + str(l)]
+        W[...] = np.random.randn(*W.shape) * 0.01
+
+    return flat, parameters
+
+
+def initialize_buffers(layers_dims, m, dtype=np.float32):
+    """
+    Argumenty:
+    layers_dims -- rozmiary kolejnych warstw (n_x, n_h1, ..., n_y)
+    m -- liczba przykładów w jednym kroku uczenia
+    dtype -- typ danych (np.float32 lub np.float64)
+
+    Zwraca:
+    buffers -- słownik Pythona z tablicami alokowanymi raz na cały trening:
+               "A" -- aktywacje kolejnych warstw, A[0] to miejsce na dane wejściowe
+               "Z" -- wynik warstwy liniowej ostatniej warstwy (przed sigmoidem), do liczenia kosztu
+               "work" -- bufor pomocniczy o kształcie "Z"
+               "dZ" -- gradienty kosztu względem Z kolejnych warstw
+               "mask" -- maski Z > 0 warstw z ReLU
+               "grads_flat" -- ciągła tablica wszystkich gradientów, w tej samej kolejności co parametry
+               "grads" -- słownik Pythona z dW1, db1, ..., dWL, dbL; widoki na grads_flat
+    """
+
+    grads_flat, _ = flat_views(parameter_shapes(layers_dims), dtype)
+
+    buffers = {
+        "A": [None] + [np.zeros((n, m), dtype=dtype) for n in layers_dims[1:]],
+        "Z": np.zeros((layers_dims[-1], m), dtype=dtype),
+        "work": np.zeros((layers_dims[-1], m), dtype=dtype),
+        "dZ": [None] + [np.zeros((n, m), dtype=dtype) for n in layers_dims[1:]],
+        "mask": [None] + [np.zeros((n, m), dtype=bool) for n in layers_dims[1:]],
+        "grads_flat": grads_flat,
+        "grads": parameters_from_flat(grads_flat, layers_dims, prefix="d"),
+    }
+
+    return buffers
+
+
+def layers_of(parameters, grads=None):
+    """
+    Argumenty:
+    parameters -- słownik Pythona z W1, b1, ..., WL, bL
+    grads -- opcjonalny słownik Pythona z dW1, db1, ..., dWL, dbL
+
+    Zwraca:
+    layers -- lista krotek (W, b) lub (W, b, dW, db) kolejnych warstw, budowana raz przed treningiem
+    """
+
+    L = len(parameters) // 2
+    if grads is None:
+        return [(parameters["W" + str(l)], parameters["b" + str(l)]) for l in range(1, L + 1)]
+
+    return [
+        (parameters["W" + str(l)], parameters["b" + str(l)], grads["dW" + str(l)], grads["db" + str(l)])
+        for l in range(1, L + 1)
+    ]
+
+
+def L_model_forward(X, layers, buffers):
+    """
+    Propagacja wprzód LINEAR -> RELU powtórzona L-1 razy, potem LINEAR -> SIGMOID, w miejscu w buforach.
+
+    Argumenty:
+    X -- dane wejściowe, kształt (n_x, m), ten sam dtype co bufory
+    layers -- lista krotek (W, b, dW, db) z layers_of
+    buffers -- słownik Pythona z initialize_buffers
+
+    Zwraca:
+    AL -- wynik ostatniej warstwy, kształt (1, m); widok na bufor nadpisywany w kolejnym kroku
+    """
+
+    A = buffers["A"]
+    A[0] = X
+    L = len(layers)
+
+    for l in range(1, L + 1):
+        W, b = layers[l - 1][:2]
+        # Z ostatniej warstwy zostaje w buforze, koszt jest liczony z niego (L_model_cost)
+        Z = A[l] if l < L else buffers["Z"]
+        np.dot(W, A[l - 1], out=Z)
+        Z += b
+        if l < L:
+            np.maximum(Z, 0, out=Z)
+        else:
+            stable_sigmoid(Z, out=A[l])
+
+    return A[L]
+
+
+def L_model_cost(Y, buffers):
+    """
+    Argumenty:
+    Y -- wektor prawdziwych etykiet, kształt (1, m)
+    buffers -- słownik Pythona z initialize_buffers, po L_model_forward
+
+    Zwraca:
+    cost -- koszt entropii krzyżowej ostatniej propagacji wprzód, liczony stabilnie z Z
+    """
+
+    return cross_entropy_with_logits(buffers["Z"], Y, buffers["work"])
+
+
+def L_model_backward(Y, layers, buffers):
+    """
+    Propagacja wstecz dla L_model_forward z kosztem entropii krzyżowej, wynik w buffers["grads"].
+
+    Argumenty:
+    Y -- wektor prawdziwych etykiet, kształt (1, m)
+    layers -- lista krotek (W, b, dW, db) z layers_of
+    buffers -- słownik Pythona z initialize_buffers, po L_model_forward
+
+    Zwraca:
+    grads_flat -- ciągła tablica wszystkich gradientów
+    """
+
+    A, dZ_buffers, masks = buffers["A"], buffers["dZ"], buffers["mask"]
+    L = len(layers)
+    m = Y.shape[1]
+
+    # Entropia krzyżowa po sigmoidzie: dZ = A - Y, bez dA i bez pochodnej sigmoidu
+    dZ = dZ_buffers[L]
+    np.subtract(A[L], Y, out=dZ)
+
+    for l in range(L, 0, -1):
+        W, b, dW, db = layers[l - 1]
+        np.dot(dZ, A[l - 1].T, out=dW)
+        dW *= 1 / m
+        np.sum(dZ, axis=1, keepdims=True, out=db)
+        db *= 1 / m
+
+        if l > 1:
+            # dA warstwy l-1 od razu trafia do jej bufora dZ i jest maskowane przez ReLU
+            dZ_prev = dZ_buffers[l - 1]
+            np.dot(W.T, dZ, out=dZ_prev)
+            np.greater(A[l - 1], 0, out=masks[l - 1])
+            dZ_prev *= masks[l - 1]
+            dZ = dZ_prev
+
+    return buffers["grads_flat"]
+
+
+def update_parameters_flat(flat, grads_flat, learning_rate):
+    """
+    Argumenty:
+    flat -- ciągła tablica wszystkich parametrów, aktualizowana w miejscu
+    grads_flat -- ciągła tablica gradientów w tej samej kolejności, nadpisywana
+    learning_rate -- współczynnik uczenia się
+
+    Zwraca:
+    flat -- zaktualizowane parametry
+    """
+
+    grads_flat *= learning_rate
+    flat -= grads_flat
+
+    return flat
+
+
+def save_checkpoint(path, flat, rng, iteration):
+    """
+    Zapisuje stan uczenia, z którego L_layer_model może wznowić trening. Plik jest zapisywany obok
+    starego i podmieniany, więc przerwanie zapisu nie zostawia połowy punktu kontrolnego.
+
+    Argumenty:
+    path -- ścieżka do pliku .npz
+    flat -- ciągła tablica wszystkich parametrów
+    rng -- np.random.Generator tasujący paczki
+    iteration -- numer ostatniej ukończonej iteracji
+    """
+
+    with open(path + '.tmp', 'wb') as file:
+        np.savez(file, flat=flat, rng=json.dumps(rng.bit_generator.state), iteration=iteration)
+    os.replace(path + '.tmp', path)
+
+
+def load_checkpoint(path, flat, rng):
+    """
+    Argumenty:
+    path -- ścieżka do pliku .npz z save_checkpoint
+    flat -- ciągła tablica parametrów, nadpisywana w miejscu
+    rng -- np.random.Generator, którego stan jest odtwarzany
+
+    Zwraca:
+    iteration -- numer ostatniej ukończonej iteracji
+    """
+
+    with np.load(path) as data:
+        if data['flat'].shape != flat.shape:
+            raise ValueError(f"Checkpoint {path} has {data['flat'].size} parameters, the network has {flat.size}")
+        flat[...] = data['flat']
+        rng.bit_generator.state = json.loads(str(data['rng']))
+        return data['iteration'].item()
+
+
+def build_cache(h5_path, x_name, y_name, directory='data/cache'):
+    """
+    Zapisuje zbiór z pliku HDF5 jako pliki .npy (obrazy spłaszczone do wierszy, uint8), które można
+    otworzyć przez np.load(..., mmap_mode='r'). Pliki są budowane ponownie tylko gdy HDF5 jest nowszy.
+
+    Argumenty:
+    h5_path -- ścieżka do pliku HDF5
+    x_name -- nazwa zbioru z obrazami, np. 'train_set_x'
+    y_name -- nazwa zbioru z etykietami, np. 'train_set_y'
+    directory -- katalog na pliki .npy
+
+    Zwraca:
+    x_path -- ścieżka do pliku z obrazami, kształt (liczba przykładów, n_x)
+    y_path -- ścieżka do pliku z etykietami, kształt (liczba przykładów,)
+    """
+
+    x_path = os.path.join(directory, x_name + '.npy')
+    y_path = os.path.join(directory, y_name + '.npy')
+    source_time = os.path.getmtime(h5_path)
+    if all(os.path.exists(path) and os.path.getmtime(path) >= source_time for path in (x_path, y_path)):
+        return x_path, y_path
+
+    os.makedirs(directory, exist_ok=True)
+    with h5py.File(h5_path, 'r') as dataset:
+        x, y = dataset[x_name], dataset[y_name]
+        # Written through a memmap in chunks of examples, so the set never has to fit in memory
+        rows = np.lib.format.open_memmap(x_path + '.tmp', mode='w+', dtype=x.dtype, shape=(x.shape[0], int(np.prod(x.shape[1:]))))
+        for start in range(0, x.shape[0], 1024):
+            chunk = x[start:start + 1024]
+            rows[start:start + len(chunk)] = chunk.reshape(len(chunk), -1)
+        rows.flush()
+        del rows
+        np.save(y_path + '.tmp.npy', y[:].astype(np.uint8))
+    os.replace(x_path + '.tmp', x_path)
+    os.replace(y_path + '.tmp.npy', y_path)
+
+    return x_path, y_path
+
+
+def load_data_cached(directory='data/cache'):
+    """
+    Jak load_data, ale bez wczytywania danych do pamięci: obrazy i etykiety są tablicami
+    np.memmap w układzie (liczba przykładów, n_x), do użycia z minibatches.
+
+    Argumenty:
+    directory -- katalog na pliki .npy
+
+    Zwraca:
+    train_set_x -- memmap uint8 z obrazami zestawu treningowego, kształt (liczba przykładów, n_x)
+    train_set_y -- memmap uint8 z etykietami zestawu treningowego, kształt (liczba przykładów,)
+    test_set_x -- memmap uint8 z obrazami zestawu testowego
+    test_set_y -- memmap uint8 z etykietami zestawu testowego
+    """
+
+    train = build_cache('data/train_catvnoncat.h5', 'train_set_x', 'train_set_y', directory)
+    test = build_cache('data/test_catvnoncat.h5', 'test_set_x', 'test_set_y', directory)
+
+    return tuple(np.load(path, mmap_mode='r') for path in train + test)
+
+
+def validation_split(m, fraction=0.2, seed=1):
+    """
+    Losowy podział przykładów treningowych na część do uczenia i część walidacyjną, np. dla
+    Validation, tak by zbiór testowy nie wpływał na trening.
+
+    Argumenty:
+    m -- liczba przykładów treningowych
+    fraction -- część przykładów przeznaczona do walidacji
+    seed -- ziarno losowania podziału
+
+    Zwraca:
+    train_indices -- posortowane indeksy przykładów do uczenia
+    val_indices -- posortowane indeksy przykładów walidacyjnych
+    """
+
+    order = np.random.default_rng(seed).permutation(m)
+    n_val = max(1, round(m * fraction))
+    return np.sort(order[n_val:]), np.sort(order[:n_val])
+
+
+def minibatches(X, Y, batch_size, rng, scale=1 / 255, dtype=np.float32, shard=(0, 1)):
+    """
+    Argumenty:
+    X -- przykłady w wierszach: zbiór HDF5, np.memmap lub tablica numpy, kształt (liczba przykładów, ...)
+    Y -- etykiety, kształt (liczba przykładów,) lub (liczba przykładów, 1)
+    batch_size -- liczba przykładów w jednej paczce; niepełna ostatnia paczka jest pomijana
+    rng -- np.random.Generator do tasowania przykładów
+    scale -- mnożnik normalizujący wartości pikseli
+    dtype -- typ danych paczek
+    shard -- (numer, liczba części); każda paczka jest dzielona na równe części i zwracana jest tylko
+             część o danym numerze, reszta paczki trafia do innych procesów
+
+    Zwraca:
+    generator krotek (X_batch, Y_batch) o kształtach (n_x, batch_size // liczba części) i (1, batch_size // liczba części)
+    """
+
+    m = len(X)
+    worker, workers = shard
+    shard_size = batch_size // workers
+    order = rng.permutation(m)
+    for start in range(0, m - batch_size + 1, batch_size):
+        # Sorted indices read the storage front to back, HDF5 also requires them
+        indices = np.sort(order[start + worker * shard_size:start + (worker + 1) * shard_size])
+        X_batch = np.asarray(X[indices]).reshape(shard_size, -1).astype(dtype)
+        X_batch *= scale
+        Y_batch = np.asarray(Y[indices], dtype=dtype).reshape(1, shard_size)
+        yield X_batch.T, Y_batch
+
+
+def prefetch(iterator, size=2):
+    """
+    Argumenty:
+    iterator -- dowolny iterator, np. z minibatches
+    size -- ile elementów wątek w tle przygotowuje na zapas
+
+    Zwraca:
+    generator tych samych elementów; kolejne są czytane w wątku w tle, w trakcie obliczeń na bieżącym
+    """
+
+    items = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item, error=None):
+        # Gives up when the consumer stopped reading
+        while not stop.is_set():
+            try:
+                items.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as error:
+            put(done, error)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+# Data-parallel workers share the parameters, one row of gradients per worker and the barrier,
+# set up by init_data_parallel_worker
+_data_parallel = None
+
+
+def init_data_parallel_worker(barrier, parameters_buffer, grads_buffer, dtype):
+    global _data_parallel
+    flat = np.frombuffer(parameters_buffer, dtype=dtype)
+    grads = np.frombuffer(grads_buffer, dtype=dtype).reshape(-1, flat.size)
+    _data_parallel = (barrier, flat, grads)
+
+
+def epoch_rng(seed, epoch):
+    """
+    Argumenty:
+    seed -- ziarno treningu
+    epoch -- numer epoki
+
+    Zwraca:
+    rng -- np.random.Generator, taki sam w każdym procesie dla tej samej epoki
+    """
+
+    return np.random.default_rng([seed, epoch])
+
+
+def train_shard(worker, x_path, y_path, layers_dims, num_epochs, batch_size, seed):
+    """
+    Pętla procesu roboczego w data_parallel_model: w każdym kroku liczy gradient ze swojej części
+    paczki, zapisuje go w swoim wierszu pamięci współdzielonej i czeka, aż proces główny zaktualizuje
+    wspólne parametry.
+
+    Argumenty:
+    worker -- numer procesu
+    x_path, y_path -- pliki .npy z load_data_cached, otwierane jako memmap
+    layers_dims -- wymiary warstw (n_x, n_h1, ..., n_y)
+    num_epochs -- liczba epok
+    batch_size -- rozmiar całej paczki, dzielonej między procesy
+    seed -- ziarno tasowania, wspólne dla wszystkich procesów
+    """
+
+    barrier, flat, grads = _data_parallel
+    workers = len(grads)
+    X = np.load(x_path, mmap_mode='r')
+    Y = np.load(y_path, mmap_mode='r')
+
+    parameters = parameters_from_flat(flat, layers_dims)
+    buffers = initialize_buffers(layers_dims, batch_size // workers, flat.dtype)
+    layers = layers_of(parameters, buffers["grads"])
+
+    try:
+        for epoch in range(num_epochs):
+            shards = minibatches(X, Y, batch_size, epoch_rng(seed, epoch), dtype=flat.dtype, shard=(worker, workers))
+            for X_batch, Y_batch in shards:
+                L_model_forward(X_batch, layers, buffers)
+                np.copyto(grads[worker], L_model_backward(Y_batch, layers, buffers))
+                # Every gradient is written, then the parameters are updated
+                barrier.wait()
+                barrier.wait()
+    except BaseException:
+        # Do not leave the other processes waiting for this one forever
+        barrier.abort()
+        raise
+
+
+MODEL_MAGIC = b'NNIC'
+MODEL_VERSION = 1
+# magic, version, dtype ('f' float32, 'd' float64), number of layer sizes, number of parameters,
+# crc32 of the parameters; then the layer sizes, the parameters start at MODEL_ALIGNMENT
+MODEL_HEADER = struct.Struct('<4sHcBQI')
+MODEL_ALIGNMENT = 64
+
+
+def save_model(path, parameters):
+    """
+    Zapisuje parametry sieci w jednym pliku binarnym: nagłówek z wersją formatu i wymiarami warstw,
+    a za nim ciągła tablica parametrów w kolejności parameter_shapes.
+
+    Argumenty:
+    path -- ścieżka do pliku modelu
+    parameters -- słownik Pythona z W1, b1, ..., WL, bL
+    """
+
+    L = len(parameters) // 2
+    layers_dims = [parameters["W1"].shape[1]] + [parameters["W" + str(l)].shape[0] for l in range(1, L + 1)]
+    flat = np.concatenate([np.ravel(parameters[key + str(l)]) for l in range(1, L + 1) for key in ("W", "b")])
+    if flat.dtype not in (np.float32, np.float64):
+        raise ValueError(f"Cannot save parameters of type {flat.dtype}")
+
+    header = MODEL_HEADER.pack(MODEL_MAGIC, MODEL_VERSION, flat.dtype.char.encode(), len(layers_dims), flat.size, zlib.crc32(flat))
+    header += struct.pack(f'<{len(layers_dims)}I', *layers_dims)
+    header += bytes(-len(header) % MODEL_ALIGNMENT)
+    with open(path + '.tmp', 'wb') as file:
+        file.write(header)
+        file.write(flat.tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def load_model(path, verify=True):
+    """
+    Wczytuje model zapisany przez save_model; parametry nie są kopiowane, tylko mapowane z pliku.
+
+    Argumenty:
+    path -- ścieżka do pliku modelu
+    verify -- czy sprawdzić sumę kontrolną parametrów (czyta cały plik)
+
+    Zwraca:
+    flat -- np.memmap tylko do odczytu z parametrami
+    parameters -- słownik Pythona z W1, b1, ..., WL, bL; widoki na flat
+    layers_dims -- rozmiary kolejnych warstw
+    """
+
+    with open(path, 'rb') as file:
+        header = file.read(MODEL_HEADER.size)
+        if len(header) < MODEL_HEADER.size:
+            raise ValueError(f"Model {path} is truncated")
+        magic, version, dtype, count, size, crc = MODEL_HEADER.unpack(header)
+        if (magic, version) != (MODEL_MAGIC, MODEL_VERSION) or dtype not in (b'f', b'd'):
+            raise ValueError(f"Model {path} has an unknown format")
+        layers_dims = struct.unpack(f'<{count}I', file.read(4 * count))
+
+    dtype = np.dtype(dtype.decode())
+    offset = MODEL_HEADER.size + 4 * count
+    offset += -offset % MODEL_ALIGNMENT
+    if os.path.getsize(path) != offset + size * dtype.itemsize:
+        raise ValueError(f"Model {path} has a wrong size")
+    if size != sum(int(np.prod(shape)) for shape in parameter_shapes(layers_dims)):
+        raise ValueError(f"Model {path} does not match its layers {layers_dims}")
+
+    flat = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(size,))
+    if verify and zlib.crc32(flat) != crc:
+        raise ValueError(f"Model {path} is corrupted")
+
+    return flat, parameters_from_flat(flat, layers_dims), layers_dims
+
+
+class InferenceEngine():
+    """
+    Propagacja wprzód bez pamięci podręcznych potrzebnych do uczenia: przykłady są przetwarzane
+    w paczkach stałego rozmiaru, w buforach alokowanych raz. Każda warstwa to jedno mnożenie
+    macierzy wprost do bufora, a dodanie b i ReLU są wykonywane w miejscu. Normalizacja danych
+    wejściowych (scale) jest wliczona w W1, więc piksele trafiają do sieci bez osobnego mnożenia.
+
+    Argumenty:
+    parameters -- słownik Pythona z W1, b1, ..., WL, bL (np. z load_model)
+    batch_size -- liczba przykładów w jednej paczce
+    scale -- mnożnik normalizujący wartości pikseli, taki jak w uczeniu
+    dtype -- typ danych obliczeń (np.float32 lub np.float64)
+    """
+
+    def __init__(self, parameters, batch_size=256, scale=1 / 255, dtype=np.float32):
+        L = len(parameters) // 2
+        # Przykłady w wierszach, więc część ostatniej paczki to ciągły fragment bufora
+        self.layers = []
+        for l in range(1, L + 1):
+            W = np.array(parameters["W" + str(l)], dtype=dtype).T
+            if l == 1:
+                W *= scale
+            self.layers.append((np.ascontiguousarray(W), np.array(parameters["b" + str(l)], dtype=dtype).reshape(1, -1)))
+        self.batch_size = batch_size
+        self.dtype = np.dtype(dtype)
+        self.inputs = np.empty((batch_size, self.layers[0][0].shape[0]), dtype=dtype)
+        self.activations = [np.empty((batch_size, W.shape[1]), dtype=dtype) for W, b in self.layers]
+
+    def logits(self, X, out=None):
+        """
+        Argumenty:
+        X -- przykłady w wierszach, nieznormalizowane: np.memmap, tablica numpy lub zbiór HDF5,
+             kształt (liczba przykładów, ...)
+        out -- opcjonalna tablica na wynik, kształt (liczba przykładów,)
+
+        Zwraca:
+        Z -- wartości ostatniej warstwy przed sigmoidem, kształt (liczba przykładów,)
+        """
+
+        m = len(X)
+        if out is None:
+            out = np.empty(m, dtype=self.dtype)
+        for start in range(0, m, self.batch_size):
+            k = min(self.batch_size, m - start)
+            A = self.inputs[:k]
+            np.copyto(A, np.asarray(X[start:start + k]).reshape(k, -1), casting='unsafe')
+            for l, (W, b) in enumerate(self.layers):
+                Z = self.activations[l][:k]
+                np.dot(A, W, out=Z)
+                Z += b
+                if l < len(self.layers) - 1:
+                    np.maximum(Z, 0, out=Z)
+                A = Z
+            out[start:start + k] = A[:, 0]
+
+        return out
+
+    def probabilities(self, X, out=None):
+        """
+        Zwraca:
+        A -- prawdopodobieństwa klasy 1 (sigmoid z logits), kształt (liczba przykładów,)
+        """
+
+        A = self.logits(X, out)
+
+        return stable_sigmoid(A, out=A)
+
+    def predict(self, X):
+        """
+        Zwraca:
+        predictions -- przewidywane klasy (True - 'kot'), kształt (liczba przykładów,); sigmoid(Z) > 0.5
+                       wtedy i tylko wtedy, gdy Z > 0, więc sigmoid nie jest liczony
+        """
+
+        return self.logits(X) > 0
@@ -0,0 +1,176 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+# Reverse-mode automatic differentiation. The objective is traced once per number of
+# dimensions on symbolic inputs, which records a plan: a list of (operation, arguments)
+# steps. The plan is compiled into a function with one forward and one backward pass over
+# NumPy arrays of any shape, so a single call gives the gradient for a whole batch of points.
+#
+# Arguments of a step are indices of earlier steps (Node) or constants. Objectives can use
+# +, -, *, /, ** with a constant exponent, indexing x[i], np.exp, np.log, np.sqrt, np.sin,
+# np.cos and np.asarray followed by np.mean or np.sum along axis 0.
+
+
+class Node():
+    def __init__(self, plan, index):
+        self.plan = plan
+        self.index = index
+
+    def record(self, operation, *arguments):
+        self.plan.append((operation, tuple(
+            argument.index if isinstance(argument, Node) else argument for argument in arguments
+        ), tuple(isinstance(argument, Node) for argument in arguments)))
+        return Node(self.plan, len(self.plan) - 1)
+
+    def __add__(self, other):
+        return self.record('add', self, other)
+
+    def __radd__(self, other):
+        return self.record('add', other, self)
+
+    def __sub__(self, other):
+        return self.record('sub', self, other)
+
+    def __rsub__(self, other):
+        return self.record('sub', other, self)
+
+    def __mul__(self, other):
+        return self.record('mul', self, other)
+
+    def __rmul__(self, other):
+        return self.record('mul', other, self)
+
+    def __truediv__(self, other):
+        return self.record('div', self, other)
+
+    def __rtruediv__(self, other):
+        return self.record('div', other, self)
+
+    def __pow__(self, exponent):
+        if isinstance(exponent, Node):
+            raise TypeError("Only constant exponents can be differentiated")
+        return self.record('pow', self, exponent)
+
+    def __neg__(self):
+        return self.record('mul', -1, self)
+
+    # Called by NumPy ufuncs on a Node and on object arrays of Nodes
+    def exp(self):
+        return self.record('exp', self)
+
+    def log(self):
+        return self.record('log', self)
+
+    def sqrt(self):
+        return self.record('sqrt', self)
+
+    def sin(self):
+        return self.record('sin', self)
+
+    def cos(self):
+        return self.record('cos', self)
+
+
+# Forward expressions and partial derivatives of every operation, a and b are the arguments,
+# v the result and g the adjoint of the result
+FORWARD = {
+    'add': '{a} + {b}',
+    'sub': '{a} - {b}',
+    'mul': '{a} * {b}',
+    'div': '{a} / {b}',
+    'pow': '{a} ** {b}',
+    'exp': 'np.exp({a})',
+    'log': 'np.log({a})',
+    'sqrt': 'np.sqrt({a})',
+    'sin': 'np.sin({a})',
+    'cos': 'np.cos({a})',
+}
+PARTIALS = {
+    'add': ('{g}', '{g}'),
+    'sub': ('{g}', '-{g}'),
+    'mul': ('{g} * {b}', '{g} * {a}'),
+    'div': ('{g} / {b}', '-{g} * {a} / {b}**2'),
+    'pow': ('{g} * {b} * {a} ** ({b} - 1)',),
+    'exp': ('{g} * {v}',),
+    'log': ('{g} / {a}',),
+    # The derivative at 0 is infinite, take 0 (a subgradient of e.g. |x| = sqrt(x**2))
+    'sqrt': ('np.divide(0.5 * {g}, {v}, out=np.zeros(np.broadcast({g}, {v}).shape), where={v} != 0)',),
+    'sin': ('{g} * np.cos({a})',),
+    'cos': ('-{g} * np.sin({a})',),
+}
+
+
+def compile_plan(plan, dimensions):
+    # Turns the plan into the source of one function computing the gradient in a single
+    # forward and backward pass, so no time is spent interpreting the plan on every call
+    constants = []
+    names = []
+    lines = ['def gradient(x):']
+    for index, (operation, arguments, nodes) in enumerate(plan):
+        if operation == 'input':
+            names.append([])
+            lines.append(f'    v{index} = x[{arguments[0]}]')
+            continue
+        for argument, node in zip(arguments, nodes):
+            if not node and not any(argument is constant for constant in constants):
+                constants.append(argument)
+        names.append([
+            f'v{argument}' if node else f'c{next(i for i, constant in enumerate(constants) if argument is constant)}'
+            for argument, node in zip(arguments, nodes)
+        ])
+        lines.append(f'    v{index} = ' + FORWARD[operation].format(a=names[index][0], b=names[index][-1]))
+
+    output = len(plan) - 1
+    adjoints = {output}
+    gradient = [None] * dimensions
+    lines.append(f'    g{output} = np.ones(np.shape(v{output}))')
+    for index in range(output, -1, -1):
+        operation, arguments, nodes = plan[index]
+        if index not in adjoints:
+            continue
+        if operation == 'input':
+            gradient[arguments[0]] = f'g{index}'
+            continue
+        a, b = names[index][0], names[index][-1]
+        for argument, node, partial in zip(arguments, nodes, PARTIALS[operation]):
+            if not node:
+                continue
+            partial = partial.format(a=a, b=b, v=f'v{index}', g=f'g{index}')
+            if argument in adjoints:
+                lines.append(f'    g{argument} = g{argument} + {partial}')
+            else:
+                lines.append(f'    g{argument} = {partial}')
+                adjoints.add(argument)
+
+    # Assigning into the result broadcasts partials that do not depend on every point
+    lines.append(f'    result = np.zeros(({dimensions},) + np.shape(v{output}))')
+    lines += [f'    result[{i}] = {name}' for i, name in enumerate(gradient) if name is not None]
+    lines.append('    return result')
+
+    namespace = {'np': np, **{f'c{i}': constant for i, constant in enumerate(constants)}}
+    exec('\n'.join(lines), namespace)
+    return namespace['gradient']
+
+
+@lru_cache(maxsize=128)
+def trace(function, dimensions):
+    plan = [('input', (i,), (False,)) for i in range(dimensions)]
+    output = function([Node(plan, i) for i in range(dimensions)])
+    if isinstance(output, np.ndarray):
+        output = output.item()
+    if not isinstance(output, Node):
+        raise TypeError(f"{function.__name__} does not depend on its input")
+    return compile_plan(plan[:output.index + 1], dimensions)
+
+
+def gradient_of(function):
+    # Gradient with the same convention as the objective: coordinates along the first axis,
+    # x of shape (d,) for one point or (d, N) for N points
+    def gradient(x):
+        x = np.asarray(x, dtype=float)
+        return trace(function, len(x))(x)
+
+    gradient.__name__ = f'{function.__name__}_gradient'
+    return gradient
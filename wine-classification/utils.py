@@ -0,0 +1,244 @@
+import hashlib
+import json
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from sklearn.model_selection import KFold, ParameterGrid
+from sklearn.preprocessing import StandardScaler
+
+METRICS = ('accuracy', 'precision', 'recall', 'f1')
+
+
+def parse_names(path):
+    # What a UCI .names file states about its table: the numbered attribute list, the number of
+    # attributes and the number of instances of every class. Anything the file does not state is
+    # left out, the layout of these files varies.
+    with open(path, errors='replace') as file:
+        text = file.read()
+    names = {}
+
+    attributes = []
+    for number, name in re.findall(r'^\s*(\d+)\)\s*(\S.*?)\s*$', text, re.MULTILINE):
+        if int(number) == len(attributes) + 1:
+            attributes.append(name)
+    if attributes:
+        names['attributes'] = attributes
+
+    match = re.search(r'Number of Attributes\D*(\d+)', text, re.IGNORECASE)
+    if match:
+        names['n_attributes'] = int(match.group(1))
+
+    classes = dict(re.findall(r'^\s*class\s+(\S+)\s+(\d+)\s*$', text, re.MULTILINE | re.IGNORECASE))
+    if classes:
+        names['classes'] = {label: int(count) for label, count in classes.items()}
+
+    return names
+
+
+def check_names(names, X, labels, path):
+    # Raises if the parsed table does not match its .names file
+    if names.get('n_attributes', X.shape[1]) != X.shape[1]:
+        raise ValueError(f"{path} has {X.shape[1]} attributes, its names file states {names['n_attributes']}")
+    if 'attributes' in names and len(names['attributes']) != X.shape[1]:
+        raise ValueError(f"{path} has {X.shape[1]} attributes, its names file lists {len(names['attributes'])}")
+    if 'classes' in names:
+        values, counts = np.unique(labels, return_counts=True)
+        found = {str(value): int(count) for value, count in zip(values, counts)}
+        if found != names['classes']:
+            raise ValueError(f"{path} has classes {found}, its names file states {names['classes']}")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def fold_indices(n, n_splits=4, seeds=(0, 1, 2)):
+    # Train and test example indices of every (seed, fold), the same splits as KFold(shuffle=True)
+    folds = {}
+    for seed in seeds:
+        kf = KFold(n_splits=n_splits, shuffle=True, random_state=seed)
+        for fold, (train_ix, test_ix) in enumerate(kf.split(np.empty((n, 1)))):
+            folds[seed, fold] = (train_ix, test_ix)
+    return folds
+
+
+def build_dataset(data_path, names_path=None, label_column=0, directory='data/cache', chunksize=100_000):
+    # Parses a UCI comma separated table into data/cache: the features as a float32 .npy in column
+    # order (every attribute contiguous), the labels as an int64 .npy and the column names and
+    # classes as JSON. Files are named after the hash of the source, so they are rebuilt only
+    # when it changes. Rows are parsed in chunks, the table never has to fit in memory.
+    stem = os.path.join(directory, f'{os.path.splitext(os.path.basename(data_path))[0]}-{file_hash(data_path)}')
+    paths = {'X': stem + '.X.npy', 'y': stem + '.y.npy', 'meta': stem + '.json'}
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    with open(data_path) as file:
+        rows = sum(1 for line in file if line.strip())
+    os.makedirs(directory, exist_ok=True)
+    X = y = None
+    start = 0
+    for chunk in pd.read_csv(data_path, header=None, na_values='?', skipinitialspace=True, chunksize=chunksize):
+        labels = chunk.pop(chunk.columns[label_column]).astype(str).to_numpy()
+        if X is None:
+            X = np.lib.format.open_memmap(paths['X'] + '.tmp', mode='w+', dtype=np.float32,
+                                          shape=(rows, chunk.shape[1]), fortran_order=True)
+            y = np.empty(rows, dtype=object)
+        X[start:start + len(chunk)] = chunk.to_numpy(dtype=np.float32)
+        y[start:start + len(chunk)] = labels
+        start += len(chunk)
+
+    classes = np.unique(y)
+    codes = np.searchsorted(classes, y)
+    names = parse_names(names_path) if names_path else {}
+    try:
+        check_names(names, X, y, data_path)
+    except ValueError:
+        del X
+        os.remove(paths['X'] + '.tmp')
+        raise
+    columns = names.get('attributes', [f'x{i}' for i in range(X.shape[1])])
+    X.flush()
+    del X
+    if all(re.fullmatch(r'-?\d+', label) for label in classes):
+        # Integer classes keep their values, others are numbered in sorted order
+        codes = classes.astype(np.int64)[codes]
+    np.save(paths['y'] + '.tmp.npy', codes.astype(np.int64))
+    meta = {'source': data_path, 'columns': columns, 'classes': classes.tolist()}
+    with open(paths['meta'] + '.tmp', 'w') as file:
+        json.dump(meta, file, indent=1)
+
+    # Caches of older versions of the source
+    old = re.compile(re.escape(os.path.basename(stem[:-17])) + r'-[0-9a-f]{16}\.(X\.npy|y\.npy|json)$')
+    for path in os.listdir(directory):
+        if old.match(path):
+            os.remove(os.path.join(directory, path))
+    os.replace(paths['X'] + '.tmp', paths['X'])
+    os.replace(paths['y'] + '.tmp.npy', paths['y'])
+    os.replace(paths['meta'] + '.tmp', paths['meta'])
+    return paths
+
+
+def load_dataset(data_path='data/wine.data', names_path='data/wine.names', label_column=0, n_splits=4, seeds=(0, 1, 2),
+                 directory='data/cache'):
+    # Returns a dict with X (memory-mapped float32 features, examples in rows), y (int labels),
+    # columns, classes and folds, the (train, test) index arrays of every (seed, fold)
+    paths = build_dataset(data_path, names_path, label_column, directory)
+    with open(paths['meta']) as file:
+        meta = json.load(file)
+    y = np.load(paths['y'])
+    return {
+        'X': np.load(paths['X'], mmap_mode='r'),
+        'y': y,
+        'columns': meta['columns'],
+        'classes': meta['classes'],
+        'folds': fold_indices(len(y), n_splits, seeds),
+    }
+
+
+def fold_splits(X, y, n_splits=4, seeds=(0, 1, 2), folds=None):
+    # Train and test part of every (seed, fold), the scaler is fitted on the train part only
+    # so nothing about the test part leaks into training. Computed once and shared by every config.
+    # folds are precomputed index arrays, e.g. from load_dataset, only their given seeds are used.
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y)
+    if folds is None:
+        folds = fold_indices(len(y), n_splits, seeds)
+    splits = {}
+    for (seed, fold), (train_ix, test_ix) in folds.items():
+        if seed in seeds:
+            scaler = StandardScaler().fit(X[train_ix])
+            splits[seed, fold] = (scaler.transform(X[train_ix]), scaler.transform(X[test_ix]), y[train_ix], y[test_ix])
+    return splits
+
+
+def evaluate(model, split):
+    X_train, X_test, y_train, y_test = split
+    model.fit(X_train, y_train)
+    predictions = model.predict(X_test)
+    return {
+        'accuracy': accuracy_score(y_test, predictions),
+        'precision': precision_score(y_test, predictions, average='weighted', zero_division=0),
+        'recall': recall_score(y_test, predictions, average='weighted'),
+        'f1': f1_score(y_test, predictions, average='weighted'),
+    }
+
+
+# Search workers get the splits once, set up by _init_search
+_splits = None
+
+
+def _init_search(splits):
+    global _splits
+    _splits = splits
+
+
+def _run_task(estimator, params, key):
+    return evaluate(estimator(**params), _splits[key])
+
+
+def rungs(keys, min_resource, eta):
+    # Number of (seed, fold) splits every config is evaluated on after each round of halving
+    resources = []
+    resource = min_resource
+    while resource < len(keys):
+        resources.append(resource)
+        resource *= eta
+    return resources + [len(keys)]
+
+
+def search(estimators, grids, X, y, n_splits=4, seeds=(0, 1, 2), eta=3, min_resource=None, workers=None, folds=None):
+    # Successive halving over every config of every grid. A round evaluates the surviving configs
+    # on more (seed, fold) splits, in parallel on a process pool, then keeps the best 1/eta of the
+    # configs of every estimator by mean accuracy. min_resource is the number of splits of the
+    # first round, one seed's folds by default, eta=1 evaluates every config on every split.
+    # Yields a row for every finished task: estimator name, config index and params, round, seed,
+    # fold and metrics. folds are precomputed index arrays, as in fold_splits.
+    splits = fold_splits(X, y, n_splits, seeds, folds)
+    keys = list(splits)
+    configs = {name: list(ParameterGrid(grids[name])) for name in estimators}
+    alive = {name: list(range(len(configs[name]))) for name in estimators}
+    scores = {(name, index): [] for name in estimators for index in alive[name]}
+    resources = rungs(keys, min_resource or n_splits, eta) if eta > 1 else [len(keys)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_search, initargs=(splits,)) as executor:
+        done = 0
+        for rung, resource in enumerate(resources):
+            futures = {
+                executor.submit(_run_task, estimators[name], configs[name][index], key): (name, index, key)
+                for name in estimators for index in alive[name] for key in keys[done:resource]
+            }
+            try:
+                for future in as_completed(futures):
+                    name, index, key = futures[future]
+                    metrics = future.result()
+                    scores[name, index].append(metrics['accuracy'])
+                    yield {'model': name, 'config': index, 'params': configs[name][index], 'round': rung,
+                           'seed': key[0], 'fold': key[1], **metrics}
+            finally:
+                # A consumer that stops reading does not wait for the rest of the round
+                for future in futures:
+                    future.cancel()
+            done = resource
+
+            if rung < len(resources) - 1:
+                for name in estimators:
+                    ranked = sorted(alive[name], key=lambda index: -np.mean(scores[name, index]))
+                    alive[name] = ranked[:math.ceil(len(ranked) / eta)]
+
+
+def summarize(rows):
+    # Mean of every metric per config, over the splits it was evaluated on, best first
+    df = pd.DataFrame(rows)
+    df['params'] = df['params'].map(lambda params: ', '.join(f'{key}={value}' for key, value in params.items()))
+    table = df.groupby(['model', 'config', 'params'])[list(METRICS)].mean()
+    table['splits'] = df.groupby(['model', 'config', 'params']).size()
+    return table.reset_index().sort_values(['splits', 'accuracy'], ascending=False, ignore_index=True)